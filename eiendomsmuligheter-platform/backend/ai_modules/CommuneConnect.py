@@ -36,6 +36,17 @@ class CommuneConnect:
         self.api_base_url = self.config.get('api_base_url', '')
         self.api_ready = True
         
+        # Persistent HTTP session so API calls reuse connections instead of paying
+        # DNS and TLS setup on every request; sized for calls from worker threads
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f"Bearer {self.api_key}",
+            'Accept': 'application/json'
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=32)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
         # Load local regulations database
         self.regulations_db = self._load_regulations_db()
         
@@ -539,13 +550,9 @@ class CommuneConnect:
             Regulations from API
         """
         url = f"{self.api_base_url}/municipalities/{municipality}/regulations/rental-unit"
-        headers = {
-            'Authorization': f"Bearer {self.api_key}",
-            'Accept': 'application/json'
-        }
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
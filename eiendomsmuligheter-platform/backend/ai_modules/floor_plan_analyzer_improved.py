@@ -1,4 +1,5 @@
 import os
+from bisect import bisect_right
 import numpy as np
 import cv2
 import json
@@ -9,12 +10,119 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Compliance entries for requirements that are pending when a proposal needs the
+# modification and fulfilled otherwise: (requirement flag, modification type,
+# pending entry, fulfilled entry)
+MODIFICATION_REQUIREMENTS = [
+    (
+        'separate_entrance',
+        'add_exterior_door',
+        {
+            'id': 'separate_entrance',
+            'name': 'Separate entrance',
+            'status': 'pending',
+            'description': 'Separate entrance needs to be added'
+        },
+        {
+            'id': 'separate_entrance',
+            'name': 'Separate entrance',
+            'status': 'fulfilled',
+            'description': 'Property already has multiple entrances'
+        }
+    ),
+    (
+        'bathroom_required',
+        'add_bathroom',
+        {
+            'id': 'bathroom',
+            'name': 'Bathroom',
+            'status': 'pending',
+            'description': 'Bathroom needs to be added'
+        },
+        {
+            'id': 'bathroom',
+            'name': 'Bathroom',
+            'status': 'fulfilled',
+            'description': 'Property already has multiple bathrooms'
+        }
+    ),
+    (
+        'kitchen_required',
+        'add_kitchen',
+        {
+            'id': 'kitchen',
+            'name': 'Kitchen',
+            'status': 'pending',
+            'description': 'Kitchen needs to be added'
+        },
+        {
+            'id': 'kitchen',
+            'name': 'Kitchen',
+            'status': 'fulfilled',
+            'description': 'Property already has multiple kitchens'
+        }
+    )
+]
+
+# Compliance entries that are always pending when the municipality sets the flag
+PENDING_TEMPLATES = [
+    ('sound_insulation', {
+        'id': 'sound_insulation',
+        'name': 'Sound insulation',
+        'status': 'pending',
+        'description': 'Sound insulation needs to be added between units'
+    }),
+    ('fire_safety', {
+        'id': 'fire_safety',
+        'name': 'Fire safety',
+        'status': 'pending',
+        'description': 'Fire safety equipment needs to be installed'
+    }),
+    ('ventilation', {
+        'id': 'ventilation',
+        'name': 'Ventilation',
+        'status': 'pending',
+        'description': 'Proper ventilation needs to be ensured'
+    })
+]
+
+# Compliance entries that are always fulfilled; descriptions are formatted
+# with the municipal requirements (ceiling height is assumed met for now)
+MET_TEMPLATES = [
+    {
+        'id': 'ceiling_height',
+        'name': 'Ceiling height',
+        'status': 'fulfilled',
+        'description': 'Ceiling height meets the minimum requirement of {min_ceiling_height} m'
+    }
+]
+
+# Minimum room count entries; the fulfilled description is formatted with the
+# proposal, the pending one with the municipal requirements
+MIN_ROOM_COUNT_MET = {
+    'id': 'min_room_count',
+    'name': 'Minimum room count',
+    'status': 'fulfilled',
+    'description': 'Rental unit has {rooms} rooms'
+}
+MIN_ROOM_COUNT_PENDING = {
+    'id': 'min_room_count',
+    'name': 'Minimum room count',
+    'status': 'pending',
+    'description': 'Rental unit needs at least {min_room_count} rooms'
+}
+
 class ImprovedFloorPlanAnalyzer:
     """
     Enhanced floor plan analyzer that takes into account municipal requirements
     and cost-effectiveness for rental unit creation.
     """
     
+    # Rental price adjustment by unit area: units below 30, 50 and 80 m²
+    # get a higher price per m², larger units a lower one
+    _area_breaks = np.array([30, 50, 80])
+    _area_adj = np.array([1.2, 1.1, 1.0, 0.9])
+    
     def __init__(self, config_path: Optional[str] = None):
         """
         Initialize the improved floor plan analyzer.
@@ -28,6 +136,12 @@ class ImprovedFloorPlanAnalyzer:
         self.min_rental_area = self.config.get('min_rental_area', 25)  # Minimum area in m²
         self.model_loaded = False
         
+        # Precompute the static part of the compliance check per municipality
+        self._compliance_templates = {
+            name: self._compile_compliance_templates(reqs)
+            for name, reqs in self.municipal_requirements.items()
+        }
+        
         # Initialize detection models
         self._init_models()
         
@@ -224,7 +338,7 @@ class ImprovedFloorPlanAnalyzer:
                 'original_analysis': analysis_result,
                 'rental_proposals': rental_proposals,
                 'financial_analysis': financial_analysis,
-                'municipal_compliance': self._check_municipal_compliance(rental_proposals, muni_reqs)
+                'municipal_compliance': self._check_municipal_compliance(rental_proposals, muni_reqs, municipality)
             }
             
             logger.info(f"Floor plan analysis completed for {image_path}")
@@ -407,9 +521,11 @@ class ImprovedFloorPlanAnalyzer:
             {'percentage': 0.5, 'description': 'Large rental unit'}
         ]
         
-        for size in potential_sizes:
-            area = total_area * size['percentage']
-            
+        # Estimate rental income for all sizes at once
+        areas = np.array([total_area * size['percentage'] for size in potential_sizes])
+        rental_incomes = self._estimate_rental_income_batch(areas, municipality)
+        
+        for size, area, rental_income in zip(potential_sizes, areas.tolist(), rental_incomes.tolist()):
             # Skip if area is too small
             if area < self.min_rental_area:
                 continue
@@ -425,9 +541,6 @@ class ImprovedFloorPlanAnalyzer:
                 rooms = 3
                 room_types = ['living_room', 'bedroom', 'bedroom2', 'kitchen', 'bathroom']
             
-            # Calculate estimated rental income
-            rental_income = self._estimate_rental_income(area, municipality)
-            
             # Create proposal
             proposal = {
                 'id': f"proposal_{size['percentage']}",
@@ -655,125 +768,81 @@ class ImprovedFloorPlanAnalyzer:
                 }
             }
     
+    def _compile_compliance_templates(self, muni_reqs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build the compliance entries that only depend on the municipal requirements.
+        
+        The entries are shared between all proposals checked against the same
+        municipality, so they must not be modified by callers.
+        
+        Args:
+            muni_reqs: Municipal requirements
+            
+        Returns:
+            Dictionary with the modification checks as (modification type,
+            pending entry, fulfilled entry) triples, the pending minimum room
+            count entry, and the entries that are always pending or always fulfilled
+        """
+        return {
+            'modification_checks': [
+                (mod_type, pending, met)
+                for flag, mod_type, pending, met in MODIFICATION_REQUIREMENTS
+                if muni_reqs.get(flag)
+            ],
+            'min_room_count_pending': {
+                **MIN_ROOM_COUNT_PENDING,
+                'description': MIN_ROOM_COUNT_PENDING['description'].format_map(muni_reqs)
+            },
+            'always_pending': [entry for flag, entry in PENDING_TEMPLATES if muni_reqs.get(flag)],
+            'always_met': [
+                {**entry, 'description': entry['description'].format_map(muni_reqs)}
+                for entry in MET_TEMPLATES
+            ]
+        }
+    
     def _check_municipal_compliance(self, proposals: List[Dict[str, Any]], 
-                                   muni_reqs: Dict[str, Any]) -> Dict[str, Any]:
+                                   muni_reqs: Dict[str, Any],
+                                   municipality: Optional[str] = None) -> Dict[str, Any]:
         """
         Check if proposals comply with municipal requirements.
         
         Args:
             proposals: List of rental unit proposals
             muni_reqs: Municipal requirements
+            municipality: Optional municipality name, used to look up the
+                precomputed compliance entries
             
         Returns:
             Compliance check results
         """
+        templates = self._compliance_templates.get(municipality.lower()) if municipality else None
+        if templates is None:
+            templates = self._compile_compliance_templates(muni_reqs)
+        
+        modification_checks = templates['modification_checks']
         results = []
         
         for proposal in proposals:
-            requirements_met = []
-            requirements_pending = []
-            
-            # Check separate entrance
-            if muni_reqs['separate_entrance']:
-                if any(mod['type'] == 'add_exterior_door' for mod in proposal['modifications']):
-                    requirements_pending.append({
-                        'id': 'separate_entrance',
-                        'name': 'Separate entrance',
-                        'status': 'pending',
-                        'description': 'Separate entrance needs to be added'
-                    })
-                else:
-                    requirements_met.append({
-                        'id': 'separate_entrance',
-                        'name': 'Separate entrance',
-                        'status': 'fulfilled',
-                        'description': 'Property already has multiple entrances'
-                    })
-            
-            # Check bathroom
-            if muni_reqs['bathroom_required']:
-                if any(mod['type'] == 'add_bathroom' for mod in proposal['modifications']):
-                    requirements_pending.append({
-                        'id': 'bathroom',
-                        'name': 'Bathroom',
-                        'status': 'pending',
-                        'description': 'Bathroom needs to be added'
-                    })
-                else:
-                    requirements_met.append({
-                        'id': 'bathroom',
-                        'name': 'Bathroom',
-                        'status': 'fulfilled',
-                        'description': 'Property already has multiple bathrooms'
-                    })
-            
-            # Check kitchen
-            if muni_reqs['kitchen_required']:
-                if any(mod['type'] == 'add_kitchen' for mod in proposal['modifications']):
-                    requirements_pending.append({
-                        'id': 'kitchen',
-                        'name': 'Kitchen',
-                        'status': 'pending',
-                        'description': 'Kitchen needs to be added'
-                    })
-                else:
-                    requirements_met.append({
-                        'id': 'kitchen',
-                        'name': 'Kitchen',
-                        'status': 'fulfilled',
-                        'description': 'Property already has multiple kitchens'
-                    })
+            # Requirements are pending if the proposal needs the modification
+            modification_types = {mod['type'] for mod in proposal['modifications']}
+            requirements_pending = [
+                pending for mod_type, pending, _ in modification_checks if mod_type in modification_types
+            ]
+            requirements_met = [
+                met for mod_type, _, met in modification_checks if mod_type not in modification_types
+            ]
             
             # Check minimum room count
             if proposal['rooms'] >= muni_reqs['min_room_count']:
                 requirements_met.append({
-                    'id': 'min_room_count',
-                    'name': 'Minimum room count',
-                    'status': 'fulfilled',
-                    'description': f"Rental unit has {proposal['rooms']} rooms"
+                    **MIN_ROOM_COUNT_MET,
+                    'description': MIN_ROOM_COUNT_MET['description'].format_map(proposal)
                 })
             else:
-                requirements_pending.append({
-                    'id': 'min_room_count',
-                    'name': 'Minimum room count',
-                    'status': 'pending',
-                    'description': f"Rental unit needs at least {muni_reqs['min_room_count']} rooms"
-                })
-            
-            # Check sound insulation
-            if muni_reqs['sound_insulation']:
-                requirements_pending.append({
-                    'id': 'sound_insulation',
-                    'name': 'Sound insulation',
-                    'status': 'pending',
-                    'description': 'Sound insulation needs to be added between units'
-                })
-            
-            # Check fire safety
-            if 'fire_safety' in muni_reqs and muni_reqs['fire_safety']:
-                requirements_pending.append({
-                    'id': 'fire_safety',
-                    'name': 'Fire safety',
-                    'status': 'pending',
-                    'description': 'Fire safety equipment needs to be installed'
-                })
-            
-            # Check ventilation
-            if muni_reqs['ventilation']:
-                requirements_pending.append({
-                    'id': 'ventilation',
-                    'name': 'Ventilation',
-                    'status': 'pending',
-                    'description': 'Proper ventilation needs to be ensured'
-                })
+                requirements_pending.append(templates['min_room_count_pending'])
             
-            # Check ceiling height (assume it's met for now)
-            requirements_met.append({
-                'id': 'ceiling_height',
-                'name': 'Ceiling height',
-                'status': 'fulfilled',
-                'description': f"Ceiling height meets the minimum requirement of {muni_reqs['min_ceiling_height']} m"
-            })
+            requirements_pending += templates['always_pending']
+            requirements_met += templates['always_met']
             
             result = {
                 'proposal_id': proposal['id'],
@@ -803,6 +872,34 @@ class ImprovedFloorPlanAnalyzer:
         Returns:
             Estimated monthly rental income
         """
+        adjustment = self._area_adj[bisect_right(self._area_breaks, area)]
+        return float(area * self._rental_price_per_sqm(municipality) * adjustment)
+    
+    def _estimate_rental_income_batch(self, areas: np.ndarray, municipality: str) -> np.ndarray:
+        """
+        Estimate monthly rental income for several unit areas in one municipality.
+        
+        Args:
+            areas: Rental unit areas in m²
+            municipality: Municipality name
+            
+        Returns:
+            Estimated monthly rental income per area
+        """
+        areas = np.asarray(areas, dtype=float)
+        adjustments = self._area_adj[np.searchsorted(self._area_breaks, areas, side='right')]
+        return areas * self._rental_price_per_sqm(municipality) * adjustments
+    
+    def _rental_price_per_sqm(self, municipality: str) -> float:
+        """
+        Get the monthly rental price per m² for a municipality.
+        
+        Args:
+            municipality: Municipality name
+            
+        Returns:
+            Monthly rental price per m², using Oslo as default
+        """
         # Get rental income data for the municipality
         rental_data = self.config.get('rental_income_data', {}).get(municipality.lower())
         
@@ -810,22 +907,7 @@ class ImprovedFloorPlanAnalyzer:
             # Use Oslo as default
             rental_data = self.config.get('rental_income_data', {}).get('oslo')
         
-        # Calculate base rental income
-        base_income = area * rental_data['per_sqm']
-        
-        # Apply adjustments based on area
-        if area < 30:
-            # Small units have higher per m² price
-            adjustment = 1.2
-        elif area < 50:
-            adjustment = 1.1
-        elif area < 80:
-            adjustment = 1.0
-        else:
-            # Larger units have lower per m² price
-            adjustment = 0.9
-        
-        return base_income * adjustment
+        return rental_data['per_sqm']
 
 # Example usage
 if __name__ == "__main__":
@@ -4,16 +4,135 @@ KartverketAPI - Integration with Norwegian Mapping Authority (Kartverket)
 This module provides a client for the Kartverket API, allowing access to
 property data and maps.
 """
-import requests
+import httpx
+import orjson
 import logging
 import os
-import json
-from typing import Dict, List, Any, Optional, Union
-from datetime import datetime, timedelta
+import time
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import Dict, List, Any, Optional, Tuple, Union
 import math
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Elevation lookups are cached per coordinate rounded to this many decimals
+# (~1 m), so nearby terrain profiles share cache entries
+ELEVATION_CACHE_PRECISION = 5
+
+# Maximum number of API responses kept in the response cache
+RESPONSE_CACHE_SIZE = 1024
+
+# Maximum number of encoded GeoJSON boundaries kept in the boundary cache
+BOUNDARY_CACHE_SIZE = 4096
+
+# Maximum number of rounded coordinates kept in the elevation cache
+ELEVATION_CACHE_SIZE = 65536
+
+# Coordinates closer than this (in degrees) are treated as the same point
+COORDINATE_EPSILON = 1e-9
+
+# Degrees to radians factor and mean Earth radius in kilometers
+_DEG2RAD = math.pi / 180.0
+_EARTH_R_KM = 6371.0
+
+# Below this |Δlat| + |Δlon| (in degrees, roughly 10 km) distances use the
+# equirectangular approximation, which is accurate to well under a meter there
+EQUIRECT_THRESHOLD = 0.1
+
+# Raised by the data methods when mock mode is switched off
+LIVE_MODE_UNSUPPORTED = (
+    "Live Kartverket lookups are not implemented yet; "
+    "unset KARTVERKET_MOCK or set it to 1 to use mock data"
+)
+
+# Mock property data served in mock mode
+MOCK_PROPERTIES = [
+    {
+        "property_id": "3005-12-345-6-7",
+        "address": "Solbergveien 47, 3057 Solbergmoen",
+        "municipality_code": "3005",
+        "municipality_name": "Drammen",
+        "gnr": 12,
+        "bnr": 345,
+        "fnr": 6,
+        "snr": 7,
+        "area": 850.5,
+        "property_type": "Bolig",
+        "coordinates": {
+            "latitude": 59.7563,
+            "longitude": 10.2548,
+            "epsg": "EPSG:4326"
+        }
+    }
+]
+
+
+def _normalize_address(address: str) -> str:
+    """Normalize an address to its street part for lookups, e.g. 'solbergveien 47'."""
+    return " ".join(address.split(",", 1)[0].casefold().split())
+
+
+@lru_cache(maxsize=4096)
+def _mock_elevation(latitude: float, longitude: float) -> Optional[float]:
+    """Mock elevation model in meters: sine wave based on coordinates."""
+    if latitude and longitude:
+        return round(100 + 50 * math.sin(latitude * 10) * math.cos(longitude * 10), 2)
+    return None
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Calculate the great circle distance between two coordinates in kilometers.
+    
+    Short distances use the cheaper equirectangular approximation. For longer
+    ones, coordinates are rounded to 6 decimals (~0.1 m) and ordered so that
+    A→B and B→A share the same haversine cache entry.
+    
+    Args:
+        lat1: Start latitude
+        lon1: Start longitude
+        lat2: End latitude
+        lon2: End longitude
+        
+    Returns:
+        Distance in kilometers
+    """
+    if abs(lat2 - lat1) + abs(lon2 - lon1) < EQUIRECT_THRESHOLD:
+        return _equirect_km(lat1, lon1, lat2, lon2)
+    
+    start = (round(lat1, 6), round(lon1, 6))
+    end = (round(lat2, 6), round(lon2, 6))
+    if end < start:
+        start, end = end, start
+    return _haversine_km(*start, *end)
+
+
+def _equirect_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Equirectangular distance approximation in kilometers, see haversine_distance."""
+    x = (lon2 - lon1) * _DEG2RAD * math.cos((lat1 + lat2) * (0.5 * _DEG2RAD))
+    y = (lat2 - lat1) * _DEG2RAD
+    return math.sqrt(x * x + y * y) * _EARTH_R_KM
+
+
+@lru_cache(maxsize=4096)
+def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance in kilometers, see haversine_distance."""
+    # Convert latitude and longitude from degrees to radians
+    lat1_rad = lat1 * _DEG2RAD
+    lon1_rad = lon1 * _DEG2RAD
+    lat2_rad = lat2 * _DEG2RAD
+    lon2_rad = lon2 * _DEG2RAD
+    
+    # Haversine formula
+    dlon = lon2_rad - lon1_rad
+    dlat = lat2_rad - lat1_rad
+    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    
+    return c * _EARTH_R_KM
+
 class KartverketAPI:
     """Client for the Kartverket API."""
     
@@ -21,49 +140,80 @@ class KartverketAPI:
         """Initialize the Kartverket API client."""
         self.api_key = api_key or os.getenv("KARTVERKET_API_KEY")
         
+        # Serve mock data instead of calling Kartverket. Live mode is an explicit
+        # opt-in (KARTVERKET_MOCK=0), and until its responses are mapped into the
+        # mock data's shape the data methods raise rather than return raw API JSON.
+        self._mock_mode = os.getenv("KARTVERKET_MOCK", "1") == "1"
+        
         # Base URLs for different Kartverket APIs
         self.matrikkel_url = "https://matrikkel.api.kartverket.no/v1"
         self.ssrfakta_url = "https://ws.geonorge.no/SKWS/wfs/v2"
         self.elevation_url = "https://api.kartverket.no/høydedata/v1/punkter"
         
-        # Cache for API responses
-        self.cache = {}
-        self.cache_expiration = {}
-        self.cache_duration = timedelta(hours=24)  # Cache for 24 hours
+        # LRU cache for API responses, holding (expiry, data) per request
+        self.cache: "OrderedDict[Tuple[str, Tuple], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.cache_duration = 24 * 60 * 60  # Cache for 24 hours (seconds)
+        self.elevation_cache: "OrderedDict[Tuple[float, float], Optional[float]]" = OrderedDict()
+        self.boundary_cache: "OrderedDict[Tuple[str, int, int], bytes]" = OrderedDict()
+        
+        # Hashed indexes over the mock properties; both return the same dicts
+        self._addr_index: Dict[str, Dict[str, Any]] = {
+            _normalize_address(prop["address"]): prop for prop in MOCK_PROPERTIES
+        }
+        self._matrikkel_index: Dict[Tuple[str, int, int], Dict[str, Any]] = {
+            (prop["municipality_code"], prop["gnr"], prop["bnr"]): prop for prop in MOCK_PROPERTIES
+        }
+        
+        # Shared HTTP client so connections are kept alive between requests.
+        # The API key header is set once here rather than on every request.
+        self._client = httpx.AsyncClient(
+            headers={"X-API-Key": self.api_key} if self.api_key else None,
+            http2=True,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
+        
+        # Request functions bound to each Kartverket endpoint; callers only pass params
+        self._fetch_matrikkel = partial(self._make_request, self.matrikkel_url)
+        self._fetch_ssrfakta = partial(self._make_request, self.ssrfakta_url)
+        self._fetch_elevation = partial(self._make_request, self.elevation_url)
         
         logger.info("KartverketAPI initialized")
     
-    def _make_request(self, url: str, params: Dict[str, Any] = None, headers: Dict[str, str] = None) -> Dict[str, Any]:
+    async def close(self) -> None:
+        """Close the underlying HTTP client and its pooled connections."""
+        await self._client.aclose()
+    
+    async def _make_request(self, url: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
         """Make a request to the Kartverket API."""
-        if not headers:
-            headers = {}
-        
-        if self.api_key:
-            headers["X-API-Key"] = self.api_key
-        
         # Check cache
-        cache_key = f"{url}_{json.dumps(params or {})}"
-        if cache_key in self.cache and datetime.now() < self.cache_expiration.get(cache_key, datetime.now()):
-            logger.info(f"Using cached response for {url}")
-            return self.cache[cache_key]
+        cache_key = (url, tuple(sorted(params.items())) if params else ())
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            if time.monotonic() < cached[0]:
+                logger.info(f"Using cached response for {url}")
+                self.cache.move_to_end(cache_key)
+                return cached[1]
+            del self.cache[cache_key]
         
         try:
-            response = requests.get(url, params=params, headers=headers)
+            response = await self._client.get(url, params=params)
             response.raise_for_status()
             
             # Parse response
             data = response.json()
             
-            # Cache response
-            self.cache[cache_key] = data
-            self.cache_expiration[cache_key] = datetime.now() + self.cache_duration
+            # Cache response, evicting the least recently used entry when full
+            self.cache[cache_key] = (time.monotonic() + self.cache_duration, data)
+            if len(self.cache) > RESPONSE_CACHE_SIZE:
+                self.cache.popitem(last=False)
             
             return data
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Error making request to {url}: {str(e)}")
             raise
     
-    def get_property_by_address(self, address: str, municipality: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    async def get_property_by_address(self, address: str, municipality: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Get property information by address.
         
@@ -74,33 +224,13 @@ class KartverketAPI:
         Returns:
             Property information if found, None otherwise
         """
-        # For demonstration purposes, we'll use a mock response
-        # In a real implementation, this would make an API call to Kartverket
+        if not self._mock_mode:
+            raise NotImplementedError(LIVE_MODE_UNSUPPORTED)
         
-        # Mock search by address
-        if "solbergveien" in address.lower():
-            return {
-                "property_id": "3005-12-345-6-7",
-                "address": "Solbergveien 47, 3057 Solbergmoen",
-                "municipality_code": "3005",
-                "municipality_name": "Drammen",
-                "gnr": 12,
-                "bnr": 345,
-                "fnr": 6,
-                "snr": 7,
-                "area": 850.5,
-                "property_type": "Bolig",
-                "coordinates": {
-                    "latitude": 59.7563,
-                    "longitude": 10.2548,
-                    "epsg": "EPSG:4326"
-                }
-            }
-        
-        # If address not found in our mock data
-        return None
+        # Mock search by address, None if not found in our mock data
+        return self._addr_index.get(_normalize_address(address))
     
-    def get_property_by_matrikkel(self, municipality_code: str, gnr: int, bnr: int, 
+    async def get_property_by_matrikkel(self, municipality_code: str, gnr: int, bnr: int, 
                                  fnr: Optional[int] = None, snr: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         Get property information by matrikkel numbers.
@@ -115,33 +245,13 @@ class KartverketAPI:
         Returns:
             Property information if found, None otherwise
         """
-        # For demonstration purposes, we'll use a mock response
-        # In a real implementation, this would make an API call to Kartverket
+        if not self._mock_mode:
+            raise NotImplementedError(LIVE_MODE_UNSUPPORTED)
         
-        # Mock property lookup
-        if municipality_code == "3005" and gnr == 12 and bnr == 345:
-            return {
-                "property_id": "3005-12-345-6-7",
-                "address": "Solbergveien 47, 3057 Solbergmoen",
-                "municipality_code": "3005",
-                "municipality_name": "Drammen",
-                "gnr": 12,
-                "bnr": 345,
-                "fnr": 6,
-                "snr": 7,
-                "area": 850.5,
-                "property_type": "Bolig",
-                "coordinates": {
-                    "latitude": 59.7563,
-                    "longitude": 10.2548,
-                    "epsg": "EPSG:4326"
-                }
-            }
-        
-        # If property not found in our mock data
-        return None
+        # Mock property lookup, None if not found in our mock data
+        return self._matrikkel_index.get((municipality_code, gnr, bnr))
     
-    def get_elevation_data(self, latitude: float, longitude: float) -> Optional[float]:
+    async def get_elevation_data(self, latitude: float, longitude: float) -> Optional[float]:
         """
         Get elevation data for a specific coordinate.
         
@@ -152,18 +262,64 @@ class KartverketAPI:
         Returns:
             Elevation in meters above sea level, or None if not available
         """
-        # For demonstration purposes, this is a mock implementation
-        # In a real implementation, this would make an API call to Kartverket's elevation API
+        return (await self.get_elevation_data_batch([(latitude, longitude)]))[0]
+    
+    async def get_elevation_data_batch(self, points: List[Tuple[float, float]]) -> List[Optional[float]]:
+        """
+        Get elevation data for several coordinates at once.
         
-        # Extremely simplified elevation model: sine wave based on coordinates
-        if latitude and longitude:
-            # Mock elevation calculations
-            elevation = 100 + 50 * math.sin(latitude * 10) * math.cos(longitude * 10)
-            return round(elevation, 2)
+        Points already in the elevation cache are served from it, and the
+        remaining points are fetched together in a single request.
         
-        return None
+        Args:
+            points: List of (latitude, longitude) pairs in EPSG:4326
+            
+        Returns:
+            Elevations in meters above sea level (None if not available),
+            in the same order as the given points
+        """
+        keys = [
+            (round(lat, ELEVATION_CACHE_PRECISION), round(lon, ELEVATION_CACHE_PRECISION))
+            for lat, lon in points
+        ]
+        
+        # Collect the cached points locally, so evictions below can't drop them
+        elevations: Dict[Tuple[float, float], Optional[float]] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            if key in self.elevation_cache:
+                self.elevation_cache.move_to_end(key)
+                elevations[key] = self.elevation_cache[key]
+            else:
+                missing.append(key)
+        
+        # Only fetch the points we don't already have
+        if missing:
+            fetched = dict(zip(missing, await self._fetch_elevations(missing)))
+            elevations.update(fetched)
+            self.elevation_cache.update(fetched)
+            while len(self.elevation_cache) > ELEVATION_CACHE_SIZE:
+                self.elevation_cache.popitem(last=False)
+        
+        return [elevations[key] for key in keys]
+    
+    async def _fetch_elevations(self, points: List[Tuple[float, float]]) -> List[Optional[float]]:
+        """
+        Fetch elevation data for a list of coordinates in one request.
+        
+        Args:
+            points: List of (latitude, longitude) pairs in EPSG:4326
+            
+        Returns:
+            Elevations in meters above sea level, in the same order as the given points
+        """
+        if not self._mock_mode:
+            raise NotImplementedError(LIVE_MODE_UNSUPPORTED)
+        
+        # Extremely simplified elevation model: sine wave based on coordinates
+        return [_mock_elevation(lat, lon) for lat, lon in points]
     
-    def get_terrain_profile(self, start_lat: float, start_lon: float, 
+    async def get_terrain_profile(self, start_lat: float, start_lon: float, 
                           end_lat: float, end_lon: float, 
                           num_points: int = 100) -> List[Dict[str, float]]:
         """
@@ -179,29 +335,71 @@ class KartverketAPI:
         Returns:
             List of points with lat, lon, and elevation
         """
-        # For demonstration purposes, this is a mock implementation
-        # In a real implementation, this would make an API call to Kartverket's elevation API
-        
-        profile = []
-        for i in range(num_points):
-            # Interpolate between start and end coordinates
-            fraction = i / (num_points - 1)
-            lat = start_lat + fraction * (end_lat - start_lat)
-            lon = start_lon + fraction * (end_lon - start_lon)
-            
-            # Get elevation for this point
-            elevation = self.get_elevation_data(lat, lon)
-            
-            profile.append({
+        profile = await self.get_terrain_profile_arrays(start_lat, start_lon, end_lat, end_lon, num_points)
+        columns = zip(
+            profile["latitude"].tolist(),
+            profile["longitude"].tolist(),
+            profile["elevation"].tolist(),
+            profile["distance"].tolist()
+        )
+        
+        return [
+            {
                 "latitude": lat,
                 "longitude": lon,
-                "elevation": elevation,
-                "distance": fraction * self._haversine_distance(start_lat, start_lon, end_lat, end_lon)
-            })
+                "elevation": None if math.isnan(elevation) else elevation,
+                "distance": distance
+            }
+            for lat, lon, elevation, distance in columns
+        ]
+    
+    async def get_terrain_profile_arrays(self, start_lat: float, start_lon: float, 
+                                       end_lat: float, end_lon: float, 
+                                       num_points: int = 100) -> Dict[str, np.ndarray]:
+        """
+        Get terrain profile between two coordinates as one array per field.
+        
+        Suited for numeric consumers, e.g. np.gradient(profile["elevation"], profile["distance"]).
+        
+        Args:
+            start_lat: Start latitude
+            start_lon: Start longitude
+            end_lat: End latitude
+            end_lon: End longitude
+            num_points: Number of points in the profile
+            
+        Returns:
+            Dictionary with latitude, longitude, elevation (NaN where not
+            available) and distance arrays of length num_points
+        """
+        # Start and end are the same point, so the profile is flat at zero distance
+        if abs(end_lat - start_lat) < COORDINATE_EPSILON and abs(end_lon - start_lon) < COORDINATE_EPSILON:
+            elevation = await self.get_elevation_data(start_lat, start_lon)
+            return {
+                "latitude": np.full(num_points, start_lat),
+                "longitude": np.full(num_points, start_lon),
+                "elevation": np.full(num_points, np.nan if elevation is None else elevation),
+                "distance": np.zeros(num_points)
+            }
         
-        return profile
+        total_distance = self._haversine_distance(start_lat, start_lon, end_lat, end_lon)
+        
+        # Interpolate between start and end coordinates
+        fractions = np.arange(num_points) / (num_points - 1)
+        latitudes = start_lat + fractions * (end_lat - start_lat)
+        longitudes = start_lon + fractions * (end_lon - start_lon)
+        
+        # Get elevation for all points in one batch
+        elevations = await self.get_elevation_data_batch(list(zip(latitudes.tolist(), longitudes.tolist())))
+        
+        return {
+            "latitude": latitudes,
+            "longitude": longitudes,
+            "elevation": np.array([np.nan if e is None else e for e in elevations], dtype=float),
+            "distance": fractions * total_distance
+        }
     
-    def get_property_boundaries(self, municipality_code: str, gnr: int, bnr: int) -> Optional[Dict[str, Any]]:
+    async def get_property_boundaries(self, municipality_code: str, gnr: int, bnr: int) -> Optional[Dict[str, Any]]:
         """
         Get property boundaries in GeoJSON format.
         
@@ -213,8 +411,8 @@ class KartverketAPI:
         Returns:
             GeoJSON polygon representing the property boundaries, or None if not available
         """
-        # For demonstration purposes, this is a mock implementation
-        # In a real implementation, this would make an API call to Kartverket
+        if not self._mock_mode:
+            raise NotImplementedError(LIVE_MODE_UNSUPPORTED)
         
         # Mock simple polygon for a property
         if municipality_code == "3005" and gnr == 12 and bnr == 345:
@@ -241,6 +439,38 @@ class KartverketAPI:
         
         return None
     
+    async def get_property_boundaries_geojson(self, municipality_code: str, gnr: int, bnr: int) -> Optional[bytes]:
+        """
+        Get property boundaries as encoded GeoJSON.
+        
+        The encoded feature is cached per property, so repeated requests skip
+        both the lookup and the JSON serialization.
+        
+        Args:
+            municipality_code: Municipality code (kommunenummer)
+            gnr: Gårdsnummer
+            bnr: Bruksnummer
+            
+        Returns:
+            GeoJSON feature as UTF-8 encoded bytes, or None if not available
+        """
+        cache_key = (municipality_code, gnr, bnr)
+        encoded = self.boundary_cache.get(cache_key)
+        if encoded is not None:
+            self.boundary_cache.move_to_end(cache_key)
+            return encoded
+        
+        feature = await self.get_property_boundaries(municipality_code, gnr, bnr)
+        if feature is None:
+            return None
+        
+        encoded = orjson.dumps(feature, option=orjson.OPT_SERIALIZE_NUMPY)
+        self.boundary_cache[cache_key] = encoded
+        if len(self.boundary_cache) > BOUNDARY_CACHE_SIZE:
+            self.boundary_cache.popitem(last=False)
+        
+        return encoded
+    
     def _haversine_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """
         Calculate the great circle distance between two coordinates in kilometers.
@@ -254,17 +484,7 @@ class KartverketAPI:
         Returns:
             Distance in kilometers
         """
-        # Convert latitude and longitude from degrees to radians
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-        
-        # Haversine formula
-        dlon = lon2_rad - lon1_rad
-        dlat = lat2_rad - lat1_rad
-        a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        radius = 6371  # Earth radius in kilometers
-        
-        return c * radius 
\ No newline at end of file
+        return haversine_distance(lat1, lon1, lat2, lon2)
+
+# Initialize the default API client
+kartverket_api = KartverketAPI()
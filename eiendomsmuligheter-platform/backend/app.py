@@ -11,9 +11,10 @@ import sys
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from dotenv import load_dotenv
 import traceback
+from pathlib import Path
 
 # Legg til prosjektets rotmappe i PYTHONPATH
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -34,40 +35,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger("eiendomsmuligheter")
 
-# Import AI modules
-from ai_modules import AlterraML, CommuneConnect
-
-# Initialize AI modules
-alterra_ml = AlterraML()
-commune_connect = CommuneConnect()
+# Kartverket client with a shared connection pool
+from api.KartverketAPI import kartverket_api
 
 # Opprett FastAPI-app
 app = FastAPI(
     title="Eiendomsmuligheter API",
     description="API for å analysere og visualisere eiendomsdata",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse
 )
 
 # Konfigurer CORS for å tillate forespørsler fra frontend
+# Tillatte domener settes som kommaseparert liste i ALLOWED_ORIGINS
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # I produksjon bør du begrense dette til faktiske domener
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-New-Token"],
 )
 
 # Statiske filer
-os.makedirs(os.path.join(SCRIPT_DIR, "static"), exist_ok=True)
-os.makedirs("static/heightmaps", exist_ok=True)
-os.makedirs("static/textures", exist_ok=True)
-os.makedirs("static/models", exist_ok=True)
-os.makedirs("static/cache", exist_ok=True)
-app.mount("/api/static", StaticFiles(directory="static"), name="static")
-
-# Forsøk å importere routes
+STATIC_DIRS = (
+    Path(SCRIPT_DIR) / "static",
+    Path("static/heightmaps"),
+    Path("static/textures"),
+    Path("static/models"),
+    Path("static/cache"),
+)
+
+async def _ensure_dirs():
+    """Opprett mapper for statiske filer én gang ved oppstart"""
+    for directory in STATIC_DIRS:
+        directory.mkdir(parents=True, exist_ok=True)
+
+app.add_event_handler("startup", _ensure_dirs)
+# Mappen opprettes ved oppstart, så den finnes ikke nødvendigvis ved montering
+app.mount("/api/static", StaticFiles(directory="static", check_dir=False), name="static")
+
+# Lukk HTTP-klienten mot Kartverket ved avslutning
+app.add_event_handler("shutdown", kartverket_api.close)
+
+# Forsøk å importere routes. AI-modulene eies av eiendomsrutene, som lager
+# dem ved oppstart; helsesjekken leser dem derfra.
+property_routes = None
 try:
+    from routes import property_routes
     from routes.property_routes import router as property_router
     from routes.auth_routes import router as auth_router
     
@@ -122,16 +143,26 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    alterra_ml = getattr(property_routes, "alterra_ml", None)
+    commune_connect = getattr(property_routes, "commune_connect", None)
     return {
         "status": "healthy",
         "components": {
             "ai_modules": {
-                "alterra_ml": alterra_ml.models_loaded,
-                "commune_connect": commune_connect.api_ready
+                "alterra_ml": alterra_ml is not None and alterra_ml.models_loaded,
+                "commune_connect": commune_connect is not None and commune_connect.api_ready
             }
         }
     }
 
+@app.get("/kartverket/boundaries/{municipality_code}/{gnr}/{bnr}")
+async def get_property_boundaries(municipality_code: str, gnr: int, bnr: int):
+    """Eiendomsgrenser som GeoJSON, serialisert én gang per eiendom"""
+    geojson = await kartverket_api.get_property_boundaries_geojson(municipality_code, gnr, bnr)
+    if geojson is None:
+        raise HTTPException(status_code=404, detail="Fant ikke eiendomsgrenser")
+    return Response(content=geojson, media_type="application/geo+json")
+
 # Kjøres hvis denne filen er hovedskriptet
 if __name__ == "__main__":
     import uvicorn
@@ -7,42 +7,236 @@ and secure password handling.
 """
 import os
 import jwt
+import orjson
 import time
+import asyncio
+import hashlib
+import hmac
 import logging
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Union, Any
+from typing import Dict, Optional, List, Union, Any, Tuple
 from fastapi import Depends, FastAPI, HTTPException, Security, status, Request, Response
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
+from jwt.algorithms import HMACAlgorithm
 from jwt.exceptions import PyJWTError, ExpiredSignatureError, InvalidTokenError
-from passlib.context import CryptContext
+import bcrypt
 from pydantic import BaseModel, ValidationError, EmailStr, Field
-import uuid
-import redis
-from functools import lru_cache
+from secrets import token_hex
+import redis.asyncio as redis
+from cachetools import TTLCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Security configuration with environment variables and secure defaults
-SECRET_KEY = os.getenv("SECRET_KEY", "eiendomsmuligheter_development_key")
-if os.getenv("ENVIRONMENT") == "production" and SECRET_KEY == "eiendomsmuligheter_development_key":
-    logger.warning("Using default SECRET_KEY in production environment! This is insecure.")
+# HS256 keys shorter than the hash output weaken the signature
+MIN_SECRET_KEY_BYTES = 32
+DEFAULT_SECRET_KEY = "eiendomsmuligheter_development_key"
+
+@dataclass(frozen=True)
+class AuthSettings:
+    """Token configuration, read from the environment once per process"""
+    secret_key: str
+    algorithm: str
+    access_token_expire_minutes: int
+    refresh_token_expire_days: int
+    
+    def __post_init__(self):
+        if len(self.secret_key.encode("utf-8")) < MIN_SECRET_KEY_BYTES:
+            raise ValueError(f"SECRET_KEY must be at least {MIN_SECRET_KEY_BYTES} bytes")
+
+@lru_cache(maxsize=1)
+def get_auth_settings() -> AuthSettings:
+    """
+    Get the authentication settings, loading and validating them on first use
+    
+    Returns:
+        AuthSettings instance
+        
+    Raises:
+        ValueError: If SECRET_KEY is too short
+    """
+    settings = AuthSettings(
+        secret_key=os.getenv("SECRET_KEY", DEFAULT_SECRET_KEY),
+        algorithm="HS256",
+        access_token_expire_minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440")),  # 24 hours default
+        refresh_token_expire_days=int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))  # 30 days default
+    )
+    if os.getenv("ENVIRONMENT") == "production" and settings.secret_key == DEFAULT_SECRET_KEY:
+        logger.warning("Using default SECRET_KEY in production environment! This is insecure.")
+    return settings
+
+# Loaded at import so a bad configuration fails at startup
+_settings = get_auth_settings()
+SECRET_KEY = _settings.secret_key
+ALGORITHM = _settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = _settings.access_token_expire_minutes
+REFRESH_TOKEN_EXPIRE_DAYS = _settings.refresh_token_expire_days
+
+# Per-user request limit for authenticated requests
+AUTH_RATE_LIMIT = int(os.getenv("AUTH_RATE_LIMIT", "600"))
+AUTH_RATE_LIMIT_PERIOD = int(os.getenv("AUTH_RATE_LIMIT_PERIOD", "60"))  # seconds
+
+class _PrekeyedHMACAlgorithm(HMACAlgorithm):
+    """HMAC algorithm that validates each key and derives its HMAC pads only once"""
+    
+    def __init__(self, hash_alg):
+        super().__init__(hash_alg)
+        self._prepared_keys: Dict[Union[str, bytes], bytes] = {}
+        self._contexts: Dict[bytes, Any] = {}
+    
+    def prepare_key(self, key):
+        prepared = self._prepared_keys.get(key)
+        if prepared is None:
+            prepared = super().prepare_key(key)
+            self._prepared_keys[key] = prepared
+        return prepared
+    
+    def sign(self, msg: bytes, key: bytes) -> bytes:
+        context = self._contexts.get(key)
+        if context is None:
+            context = self._contexts[key] = hmac.new(key, digestmod=self.hash_alg)
+        signer = context.copy()
+        signer.update(msg)
+        return signer.digest()
+    
+    def verify(self, msg: bytes, key: bytes, sig: bytes) -> bool:
+        return hmac.compare_digest(sig, self.sign(msg, key))
+
+# The signing keys are fixed for the process lifetime, so reuse their HMAC state.
+# Tokens are signed and verified through a private PyJWS instance, leaving
+# pyjwt's global algorithm registry (used by jwt.encode/jwt.decode) untouched.
+_hs256 = _PrekeyedHMACAlgorithm(HMACAlgorithm.SHA256)
+_jws = jwt.PyJWS(algorithms=[])
+_jws.register_algorithm(ALGORITHM, _hs256)
+
+def _encode_jwt(payload: Dict[str, Any]) -> str:
+    """
+    Encode and sign an HS256 token, serializing the payload with orjson
+    
+    Args:
+        payload: Token claims with numeric exp/iat
+        
+    Returns:
+        JWT token string
+    """
+    return _jws.encode(orjson.dumps(payload), get_auth_settings().secret_key, algorithm=ALGORITHM)
+
+# Atomic fixed-window counter: INCRBY, and start the window on the first hits
+_RATE_LIMIT_LUA = """
+local count = redis.call('INCRBY', KEYS[1], ARGV[2])
+if count == tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
 
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # 24 hours default
-REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))  # 30 days default
+# Blacklist lookup (skipped for an empty member) plus the rate-limit counter
+_TOKEN_STATE_LUA = """
+local blacklisted = 0
+if ARGV[2] ~= '' then
+    blacklisted = redis.call('SISMEMBER', KEYS[2], ARGV[2])
+end
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return {blacklisted, count}
+"""
 
 # Configure Redis for token blacklisting and rate limiting
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
-try:
-    redis_client = redis.from_url(REDIS_URL)
-    REDIS_AVAILABLE = True
-except:
-    logger.warning("Redis connection failed. Token blacklisting and rate limiting disabled.")
-    REDIS_AVAILABLE = False
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))  # seconds
+
+@lru_cache(maxsize=1)
+def get_redis() -> Optional[redis.Redis]:
+    """
+    Get the shared async Redis client, created on first use
+    
+    Returns:
+        Redis client backed by a single connection pool, or None if it could not be configured
+    """
+    try:
+        pool = redis.ConnectionPool.from_url(
+            REDIS_URL,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT
+        )
+        return redis.Redis(connection_pool=pool)
+    except Exception as e:
+        logger.warning(f"Redis connection failed: {str(e)}. Token blacklisting and rate limiting disabled.")
+        return None
+
+@lru_cache(maxsize=None)
+def _redis_script(source: str):
+    """Register a Lua script on the shared client once; later calls go out as EVALSHA"""
+    return get_redis().register_script(source)
 
 # Password hashing with bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+# Short-lived cache of successful password verifications, so repeated
+# logins with the same credentials don't rerun the full bcrypt work factor
+PASSWORD_CACHE_SIZE = 4096
+PASSWORD_CACHE_TTL = 60  # seconds
+_PASSWORD_CACHE_SECRET = os.urandom(32)
+_verified_passwords: TTLCache = TTLCache(maxsize=PASSWORD_CACHE_SIZE, ttl=PASSWORD_CACHE_TTL)
+_verified_passwords_lock = threading.Lock()
+
+class _BloomFilter:
+    """Fixed-size Bloom filter over 16-byte JTI digests (see _jti_key)"""
+    
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, digest: bytes):
+        # The digest is already uniformly random, so split it for double hashing
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+    
+    def add(self, digest: bytes) -> None:
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+    
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+# Local filter of revoked JTIs: a miss means the token is certainly not
+# blacklisted and Redis can be skipped. Only trusted once it has been loaded
+# from Redis and is following the revocation channel.
+BLACKLIST_FILTER_CAPACITY = int(os.getenv("BLACKLIST_FILTER_CAPACITY", "100000"))
+BLACKLIST_FILTER_ERROR_RATE = 1e-4
+BLACKLIST_CHANNEL = "blacklist-add"
+BLACKLIST_SYNC_RETRY = 5  # seconds
+_blacklist_filter = _BloomFilter(BLACKLIST_FILTER_CAPACITY, BLACKLIST_FILTER_ERROR_RATE)
+_blacklist_filter_ready = False
+_blacklist_sync_task: Optional[asyncio.Task] = None
+
+# Per-worker token buckets for check_rate_limit: key -> (tokens, last refill, unsynced hits).
+# Hits are pushed to the shared Redis counter every RATE_LIMIT_SYNC_EVERY requests.
+RATE_LIMIT_SYNC_EVERY = int(os.getenv("RATE_LIMIT_SYNC_EVERY", "10"))
+RATE_LIMIT_BUCKETS = 65536
+_local_buckets: "OrderedDict[str, Tuple[float, float, int]]" = OrderedDict()
+
+# Per-user permission lookups, refreshed after PERMISSION_CACHE_TTL
+PERMISSION_CACHE_SIZE = 65536
+PERMISSION_CACHE_TTL = 300  # seconds
+_permission_cache: TTLCache = TTLCache(maxsize=PERMISSION_CACHE_SIZE, ttl=PERMISSION_CACHE_TTL)
+_permission_cache_lock = threading.Lock()
+
+# Decoded JWT payloads keyed by the raw token, valid until the token's exp
+TOKEN_CACHE_SIZE = 8192
+_decoded_tokens: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
 
 # OAuth2 scheme for token handling with comprehensive scopes
 oauth2_scheme = OAuth2PasswordBearer(
@@ -115,13 +309,49 @@ class User(UserBase):
         }
 
 # Authentication functions
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
+    """Run the bcrypt check without consulting the verification cache"""
+    return bcrypt.checkpw(
+        plain_password.encode("utf-8")[:BCRYPT_MAX_PASSWORD_BYTES],
+        hashed_password.encode("utf-8")
+    )
+
+def _password_cache_key(plain_password: str, hashed_password: str) -> bytes:
+    """Keyed digest of a (password, hash) pair; the plaintext is never stored"""
+    return hashlib.blake2b(
+        plain_password.encode("utf-8") + b"\0" + hashed_password.encode("utf-8"),
+        key=_PASSWORD_CACHE_SECRET,
+        digest_size=16
+    ).digest()
+
+def _is_verification_cached(cache_key: bytes) -> bool:
+    """Check for an unexpired successful verification"""
+    with _verified_passwords_lock:
+        return cache_key in _verified_passwords
+
+def _remember_verification(cache_key: bytes) -> None:
+    """Record a successful verification, evicting the oldest entry if full"""
+    with _verified_passwords_lock:
+        _verified_passwords[cache_key] = True
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash using bcrypt"""
-    return pwd_context.verify(plain_password, hashed_password)
+    cache_key = _password_cache_key(plain_password, hashed_password)
+    if _is_verification_cached(cache_key):
+        return True
+    
+    verified = _checkpw(plain_password, hashed_password)
+    if verified:
+        # Only successes are cached, failures always pay the full cost
+        _remember_verification(cache_key)
+    return verified
 
 def get_password_hash(password: str) -> str:
     """Generate a secure password hash using bcrypt"""
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(
+        password.encode("utf-8")[:BCRYPT_MAX_PASSWORD_BYTES],
+        bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    ).decode("utf-8")
 
 def create_token(data: dict, expires_delta: Optional[timedelta] = None, token_type: str = "access") -> str:
     """
@@ -135,27 +365,25 @@ def create_token(data: dict, expires_delta: Optional[timedelta] = None, token_ty
     Returns:
         JWT token string
     """
-    to_encode = data.copy()
+    settings = get_auth_settings()
     
     # Set expiration time based on token type
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        lifetime = int(expires_delta.total_seconds())
     elif token_type == "refresh":
-        expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        lifetime = settings.refresh_token_expire_days * 86400
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        lifetime = settings.access_token_expire_minutes * 60
     
-    # Add standard JWT claims
-    to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),  # Issued at
-        "jti": str(uuid.uuid4()),  # Unique token ID for blacklisting
+    # Payload with standard JWT claims as Unix timestamps, built in one go
+    now_ts = int(time.time())
+    return _encode_jwt({
+        **data,
+        "exp": now_ts + lifetime,
+        "iat": now_ts,             # Issued at
+        "jti": token_hex(16),      # Unique token ID for blacklisting
         "type": token_type         # Token type for validation
     })
-    
-    # Sign the token
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a new access token"""
@@ -165,7 +393,50 @@ def create_refresh_token(data: dict) -> str:
     """Create a new refresh token with longer expiration"""
     return create_token(data, None, "refresh")
 
-def blacklist_token(jti: str, exp: datetime) -> bool:
+def decode_token(token: str) -> Dict[str, Any]:
+    """
+    Decode and validate a JWT token, reusing earlier results for the same token
+    
+    Args:
+        token: JWT token string
+        
+    Returns:
+        Copy of the decoded token payload
+        
+    Raises:
+        PyJWTError: If the token is invalid or has expired
+    """
+    cached = _decoded_tokens.get(token)
+    if cached is not None:
+        payload, exp = cached
+        if exp > time.time():
+            _decoded_tokens.move_to_end(token)
+            return dict(payload)
+        # Expired, let jwt.decode raise the proper error
+        del _decoded_tokens[token]
+    
+    settings = get_auth_settings()
+    # The signature is checked with the pre-keyed algorithm, the claims by pyjwt
+    _jws.decode_complete(token, settings.secret_key, algorithms=[settings.algorithm])
+    payload = jwt.decode(token, options={"verify_signature": False, "verify_exp": True})
+    
+    # Only tokens with an expiry can be cached safely
+    exp = payload.get("exp")
+    if exp is not None:
+        _decoded_tokens[token] = (payload, float(exp))
+        if len(_decoded_tokens) > TOKEN_CACHE_SIZE:
+            _decoded_tokens.popitem(last=False)
+    return dict(payload)
+
+def _blacklist_shard(exp_ts: float) -> str:
+    """Name of the blacklist SET holding tokens that expire on the given (UTC) day"""
+    return f"blacklist:day:{time.strftime('%Y%m%d', time.gmtime(exp_ts))}"
+
+def _jti_key(jti: str) -> bytes:
+    """Compact 128-bit digest of a JTI, used as the blacklist SET member"""
+    return hashlib.blake2b(jti.encode("utf-8"), digest_size=16).digest()
+
+async def blacklist_token(jti: str, exp: datetime) -> bool:
     """
     Blacklist a token by its JTI (JWT ID)
     
@@ -176,48 +447,87 @@ def blacklist_token(jti: str, exp: datetime) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    if not REDIS_AVAILABLE:
+    return await blacklist_tokens([(jti, exp)])
+
+async def blacklist_tokens(tokens: List[Tuple[str, datetime]]) -> bool:
+    """
+    Blacklist several tokens in a single Redis round-trip, e.g. on logout from all devices
+    
+    Args:
+        tokens: (JTI, expiration time) pairs to blacklist
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    redis_client = get_redis()
+    if redis_client is None:
         logger.warning("Redis not available. Token blacklisting disabled.")
         return False
     
-    # Calculate time to expiration
-    now = datetime.utcnow()
-    if exp < now:
-        # Token already expired, no need to blacklist
+    # Group by expiry day; tokens that have already expired need no entry
+    now_ts = time.time()
+    shards: Dict[str, List[bytes]] = {}
+    shard_expiry: Dict[str, int] = {}
+    for jti, exp in tokens:
+        exp_ts = exp.timestamp()
+        if exp_ts < now_ts:
+            continue
+        shard = _blacklist_shard(exp_ts)
+        shards.setdefault(shard, []).append(_jti_key(jti))
+        shard_expiry[shard] = max(shard_expiry.get(shard, 0), int(exp_ts) + 86400)
+    
+    if not shards:
         return True
     
-    ttl = int((exp - now).total_seconds())
     try:
-        # Store in Redis with TTL matching token expiration
-        redis_client.setex(f"blacklist:{jti}", ttl, "1")
+        # Tokens are grouped in one SET per expiry day, kept until the day is over
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for shard, members in shards.items():
+                pipe.sadd(shard, *members)
+                pipe.expireat(shard, shard_expiry[shard])
+            # Let every worker add the revoked digests to its local filter
+            pipe.publish(BLACKLIST_CHANNEL, b"".join(m for members in shards.values() for m in members))
+            await pipe.execute()
+        for members in shards.values():
+            for member in members:
+                _blacklist_filter.add(member)
         return True
     except Exception as e:
         logger.error(f"Failed to blacklist token: {str(e)}")
         return False
 
-def is_token_blacklisted(jti: str) -> bool:
+async def is_token_blacklisted(jti: str, exp: datetime) -> bool:
     """
     Check if a token is blacklisted
     
     Args:
         jti: The JWT ID to check
+        exp: The token expiration time
         
     Returns:
         True if blacklisted, False otherwise
     """
-    if not REDIS_AVAILABLE:
+    redis_client = get_redis()
+    if redis_client is None:
+        return False
+    
+    _ensure_blacklist_sync()
+    if _blacklist_filter_ready and _jti_key(jti) not in _blacklist_filter:
         return False
     
     try:
-        return redis_client.exists(f"blacklist:{jti}") == 1
+        return bool(await redis_client.sismember(_blacklist_shard(exp.timestamp()), _jti_key(jti)))
     except Exception as e:
         logger.error(f"Failed to check token blacklist: {str(e)}")
         return False
 
-def check_rate_limit(key: str, limit: int, period: int) -> bool:
+async def check_rate_limit(key: str, limit: int, period: int) -> bool:
     """
     Check if a rate limit has been exceeded
     
+    Requests are admitted from a local token bucket; Redis is only consulted
+    every RATE_LIMIT_SYNC_EVERY requests to enforce the limit across workers.
+    
     Args:
         key: The rate limit key (e.g. IP, user ID)
         limit: Maximum number of requests
@@ -226,26 +536,106 @@ def check_rate_limit(key: str, limit: int, period: int) -> bool:
     Returns:
         True if limit not exceeded, False otherwise
     """
-    if not REDIS_AVAILABLE:
+    now = time.monotonic()
+    tokens, last_refill, unsynced = _local_buckets.get(key, (float(limit), now, 0))
+    tokens = min(float(limit), tokens + (now - last_refill) * limit / period)
+    
+    if tokens < 1:
+        _store_bucket(key, tokens, now, unsynced)
+        return False
+    
+    tokens -= 1
+    unsynced += 1
+    if unsynced < RATE_LIMIT_SYNC_EVERY or get_redis() is None:
+        _store_bucket(key, tokens, now, unsynced)
         return True
     
+    _store_bucket(key, tokens, now, 0)
     try:
-        # Get current count
-        current = redis_client.get(f"ratelimit:{key}")
-        if current is None:
-            # First request, set to 1 with expiration
-            redis_client.setex(f"ratelimit:{key}", period, 1)
-            return True
-        
-        # Increment count
-        count = redis_client.incr(f"ratelimit:{key}")
-        if int(count) > limit:
-            return False
-        
-        return True
+        count = await _redis_script(_RATE_LIMIT_LUA)(keys=[f"ratelimit:{key}"], args=[period, unsynced])
     except Exception as e:
         logger.error(f"Failed to check rate limit: {str(e)}")
         return True  # Fail open if Redis is unavailable
+    
+    if int(count) > limit:
+        # Other workers have used up the shared window, so drain the local bucket
+        _store_bucket(key, 0.0, now, 0)
+        return False
+    return True
+
+def _store_bucket(key: str, tokens: float, last_refill: float, unsynced: int) -> None:
+    """Save a local rate-limit bucket, evicting the least recently used if full"""
+    _local_buckets[key] = (tokens, last_refill, unsynced)
+    _local_buckets.move_to_end(key)
+    if len(_local_buckets) > RATE_LIMIT_BUCKETS:
+        _local_buckets.popitem(last=False)
+
+async def check_token_state(jti: str, exp_ts: float, key: str) -> Tuple[bool, bool]:
+    """
+    Check token blacklist and rate limit in a single Redis round-trip
+    
+    Args:
+        jti: The JWT ID to check (may be empty)
+        exp_ts: The token expiration as a Unix timestamp
+        key: The rate limit key (e.g. IP, user ID)
+        
+    Returns:
+        Tuple of (blacklisted, within rate limit)
+    """
+    if get_redis() is None:
+        return False, True
+    
+    _ensure_blacklist_sync()
+    if not jti or (_blacklist_filter_ready and _jti_key(jti) not in _blacklist_filter):
+        # Certainly not revoked, so only the rate limit is left to check
+        return False, await check_rate_limit(key, AUTH_RATE_LIMIT, AUTH_RATE_LIMIT_PERIOD)
+    
+    try:
+        blacklisted, count = await _redis_script(_TOKEN_STATE_LUA)(
+            keys=[f"ratelimit:{key}", _blacklist_shard(exp_ts)],
+            args=[AUTH_RATE_LIMIT_PERIOD, _jti_key(jti) if jti else b""]
+        )
+    except Exception as e:
+        logger.error(f"Failed to check token state: {str(e)}")
+        return False, True  # Fail open if Redis is unavailable
+    
+    return bool(blacklisted), int(count) <= AUTH_RATE_LIMIT
+
+def _ensure_blacklist_sync() -> None:
+    """Start the blacklist filter sync task on the running loop if it isn't running"""
+    global _blacklist_sync_task
+    if _blacklist_sync_task is None or _blacklist_sync_task.done():
+        _blacklist_sync_task = asyncio.get_running_loop().create_task(_sync_blacklist_filter())
+
+async def _sync_blacklist_filter() -> None:
+    """Load the blacklist filter from Redis, then follow revocations published by other workers"""
+    global _blacklist_filter, _blacklist_filter_ready
+    redis_client = get_redis()
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                # Subscribe before loading so no revocation falls in between
+                await pubsub.subscribe(BLACKLIST_CHANNEL)
+                blacklist_filter = _BloomFilter(BLACKLIST_FILTER_CAPACITY, BLACKLIST_FILTER_ERROR_RATE)
+                async for shard in redis_client.scan_iter(match="blacklist:day:*"):
+                    for member in await redis_client.smembers(shard):
+                        blacklist_filter.add(member)
+                _blacklist_filter = blacklist_filter
+                _blacklist_filter_ready = True
+                
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"]
+                    for i in range(0, len(data), 16):
+                        _blacklist_filter.add(data[i:i + 16])
+        except asyncio.CancelledError:
+            _blacklist_filter_ready = False
+            raise
+        except Exception as e:
+            _blacklist_filter_ready = False
+            logger.error(f"Blacklist filter sync failed: {str(e)}")
+            await asyncio.sleep(BLACKLIST_SYNC_RETRY)
 
 async def get_current_user(
     security_scopes: SecurityScopes, 
@@ -282,13 +672,9 @@ async def get_current_user(
     )
     
     try:
-        # Decode and validate the token
-        payload = jwt.decode(
-            token, 
-            SECRET_KEY, 
-            algorithms=[ALGORITHM],
-            options={"verify_signature": True, "verify_exp": True}
-        )
+        # Decode and validate the token (expiry is verified here)
+        payload = decode_token(token)
+        exp_ts = payload.get("exp", 0)
         
         # Extract token data
         user_id: str = payload.get("sub")
@@ -307,22 +693,31 @@ async def get_current_user(
                 headers={"WWW-Authenticate": authenticate_value},
             )
         
-        # Check if token is blacklisted
-        if jti and is_token_blacklisted(jti):
+        # Check blacklist and rate limit in one round-trip. The limit is per
+        # user: behind the proxy every client shares the proxy's address.
+        blacklisted, within_limit = await check_token_state(jti, exp_ts, f"user:{user_id}")
+        if blacklisted:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token er ikke lenger gyldig",
                 headers={"WWW-Authenticate": authenticate_value},
             )
+        if not within_limit:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="For mange forespørsler",
+                headers={"Retry-After": str(AUTH_RATE_LIMIT_PERIOD)},
+            )
         
-        # Create token data
-        token_exp = datetime.fromtimestamp(payload.get("exp", 0))
-        token_data = TokenData(
-            user_id=user_id, 
-            scopes=token_scopes, 
-            exp=token_exp,
-            jti=jti,
-            email=payload.get("email")
+        # The payload is trusted after signature verification, so it is used
+        # directly instead of being revalidated through TokenData.
+        # In a real application, we would fetch the user from the database here
+        # For now, we'll simulate this by returning a user based on the token claims
+        user = User(
+            id=user_id,
+            email=payload.get("email") or f"{user_id}@example.com",  # Placeholder
+            full_name="Test User",  # Placeholder
+            scopes=token_scopes
         )
         
     except ExpiredSignatureError:
@@ -335,34 +730,20 @@ async def get_current_user(
         logger.error(f"Token validation error: {str(e)}")
         raise credentials_exception
     
-    # In a real application, we would fetch the user from the database here
-    # For now, we'll simulate this by returning a user based on the token data
-    user = User(
-        id=token_data.user_id,
-        email=token_data.email or f"{token_data.user_id}@example.com",  # Placeholder
-        full_name="Test User",  # Placeholder
-        scopes=token_data.scopes
+    # Check for required scopes, reporting the first one missing
+    granted_scopes = frozenset(token_scopes)
+    missing_scope = next(
+        (scope for scope in security_scopes.scopes if scope not in granted_scopes), None
     )
-    
-    # Check if token has expired
-    if datetime.utcnow() > token_data.exp:
+    if missing_scope is not None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token expired",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Ikke tilstrekkelige rettigheter. Krever scope: {missing_scope}",
             headers={"WWW-Authenticate": authenticate_value},
         )
     
-    # Check for required scopes
-    for scope in security_scopes.scopes:
-        if scope not in token_data.scopes:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Ikke tilstrekkelige rettigheter. Krever scope: {scope}",
-                headers={"WWW-Authenticate": authenticate_value},
-            )
-    
     # If a refresh token is about to expire, issue a new one
-    if token_data.exp - datetime.utcnow() < timedelta(minutes=30) and response:
+    if response and exp_ts - time.time() < 30 * 60:
         # In a real implementation, we would get a new token from the database
         # For now, we'll simulate this
         new_token = create_access_token(
@@ -409,10 +790,9 @@ async def get_admin_user(
     """Get a user with admin privileges"""
     return current_user
 
-@lru_cache(maxsize=128)
 def get_user_permissions(user_id: str, resource_type: str) -> Dict[str, bool]:
     """
-    Get a user's permissions for a resource type
+    Get a user's permissions for a resource type, cached for PERMISSION_CACHE_TTL seconds
     
     Args:
         user_id: User ID
@@ -421,6 +801,31 @@ def get_user_permissions(user_id: str, resource_type: str) -> Dict[str, bool]:
     Returns:
         Dictionary of permission names and boolean values
     """
+    cache_key = (user_id, resource_type)
+    with _permission_cache_lock:
+        permissions = _permission_cache.get(cache_key)
+    if permissions is not None:
+        return permissions
+    
+    permissions = _load_user_permissions(user_id, resource_type)
+    
+    with _permission_cache_lock:
+        _permission_cache[cache_key] = permissions
+    return permissions
+
+def invalidate_user_permissions(user_id: str) -> None:
+    """
+    Drop cached permissions for a user, e.g. after a role change
+    
+    Args:
+        user_id: User ID
+    """
+    with _permission_cache_lock:
+        for cache_key in [k for k in _permission_cache if k[0] == user_id]:
+            _permission_cache.pop(cache_key, None)
+
+def _load_user_permissions(user_id: str, resource_type: str) -> Dict[str, bool]:
+    """Load a user's permissions for a resource type from the backing store"""
     # In a real implementation, this would fetch permissions from the database
     # For now, return a default set of permissions
     return {
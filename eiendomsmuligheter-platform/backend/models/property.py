@@ -9,12 +9,18 @@ This module provides comprehensive data models for property representation inclu
 - Zoning regulations
 - Geographical features
 """
-from pydantic import BaseModel, Field, validator, root_validator
-from typing import List, Dict, Optional, Any, Union
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from typing import List, Dict, Literal, Optional, Any, Sequence, Union
 from datetime import datetime
-from enum import Enum
-import uuid
+from functools import lru_cache
+import math
+import os
 import re
+import sys
+import threading
+
+# Norwegian municipality codes are exactly four digits
+MUNICIPALITY_CODE_RE = re.compile(r'^\d{4}$')
 
 class Coordinates(BaseModel):
     """Geographical coordinates in different formats"""
@@ -24,8 +30,9 @@ class Coordinates(BaseModel):
     utm_easting: Optional[float] = None
     utm_northing: Optional[float] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        json_schema_extra={
             "example": {
                 "latitude": 59.9139,
                 "longitude": 10.7522,
@@ -34,6 +41,7 @@ class Coordinates(BaseModel):
                 "utm_northing": 6643812.5
             }
         }
+    )
 
 class Address(BaseModel):
     """Detailed address information"""
@@ -45,8 +53,15 @@ class Address(BaseModel):
     county: str
     country: str = "Norge"
     
-    class Config:
-        schema_extra = {
+    @field_validator('municipality', 'county', 'country')
+    @classmethod
+    def intern_region_names(cls, v):
+        """Share one string object per region name across all addresses"""
+        return sys.intern(v)
+    
+    model_config = ConfigDict(
+        frozen=True,
+        json_schema_extra={
             "example": {
                 "street": "Storgata",
                 "house_number": "1",
@@ -57,45 +72,27 @@ class Address(BaseModel):
                 "country": "Norge"
             }
         }
+    )
+
+# Enumerated values are plain Literal strings: pydantic-core checks them with a
+# single lookup and stores the str itself. Use get_args() to list valid values.
+
+# Land use categories according to Norwegian regulations
+LandUseCategory = Literal[
+    "bolig", "næring", "industri", "landbruk", "fritid", "offentlig", "kombinert", "annet"
+]
+
+# Building types according to Norwegian regulations
+BuildingType = Literal[
+    "enebolig", "tomannsbolig", "rekkehus", "leilighetsbygg", "hytte",
+    "næringsbygg", "industribygg", "landbruksbygg", "offentlig_bygg", "annet"
+]
+
+# Current zoning status of a property
+ZoningStatus = Literal["regulert", "uregulert", "regulering_pågår", "delvis_regulert"]
 
-class LandUseCategory(str, Enum):
-    """Land use categories according to Norwegian regulations"""
-    RESIDENTIAL = "bolig"
-    COMMERCIAL = "næring"
-    INDUSTRIAL = "industri"
-    AGRICULTURAL = "landbruk"
-    RECREATIONAL = "fritid"
-    PUBLIC = "offentlig"
-    COMBINED = "kombinert"
-    OTHER = "annet"
-
-class BuildingType(str, Enum):
-    """Building types according to Norwegian regulations"""
-    DETACHED_HOUSE = "enebolig"
-    SEMI_DETACHED = "tomannsbolig"
-    TOWNHOUSE = "rekkehus"
-    APARTMENT_BUILDING = "leilighetsbygg"
-    CABIN = "hytte"
-    COMMERCIAL_BUILDING = "næringsbygg"
-    INDUSTRIAL_BUILDING = "industribygg"
-    AGRICULTURAL_BUILDING = "landbruksbygg"
-    PUBLIC_BUILDING = "offentlig_bygg"
-    OTHER = "annet"
-
-class ZoningStatus(str, Enum):
-    """Current zoning status of a property"""
-    ZONED = "regulert"
-    UNZONED = "uregulert"
-    ZONING_IN_PROGRESS = "regulering_pågår"
-    PARTIALLY_ZONED = "delvis_regulert"
-
-class BuildingStatus(str, Enum):
-    """Current status of buildings on the property"""
-    EXISTING = "eksisterende"
-    UNDER_CONSTRUCTION = "under_oppføring"
-    PLANNED = "planlagt"
-    DEMOLISHED = "revet"
-    NO_BUILDINGS = "ingen_bygninger"
+# Current status of buildings on the property
+BuildingStatus = Literal["eksisterende", "under_oppføring", "planlagt", "revet", "ingen_bygninger"]
 
 class Building(BaseModel):
     """Detailed information about a building on the property"""
@@ -108,14 +105,15 @@ class Building(BaseModel):
     number_of_units: Optional[int] = None
     building_materials: Optional[List[str]] = None
     energy_rating: Optional[str] = None
-    status: BuildingStatus = BuildingStatus.EXISTING
+    status: BuildingStatus = "eksisterende"
     coordinates: Optional[Coordinates] = None
     description: Optional[str] = None
     last_renovated: Optional[int] = None
     technical_condition: Optional[str] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "id": "building-123",
                 "building_type": "enebolig",
@@ -136,6 +134,7 @@ class Building(BaseModel):
                 "technical_condition": "god"
             }
         }
+    )
 
 class ZoningRegulation(BaseModel):
     """Zoning regulations for the property"""
@@ -152,8 +151,9 @@ class ZoningRegulation(BaseModel):
     document_url: Optional[str] = None
     map_url: Optional[str] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "regulation_id": "reg-123",
                 "regulation_name": "Reguleringsplan for Storgata",
@@ -169,6 +169,7 @@ class ZoningRegulation(BaseModel):
                 "map_url": "https://kommune.no/kart/123"
             }
         }
+    )
 
 class PropertyBase(BaseModel):
     """Base information for a property"""
@@ -179,15 +180,16 @@ class PropertyBase(BaseModel):
     fnr: Optional[int] = Field(None, description="Leasehold number (festenummer)")
     snr: Optional[int] = Field(None, description="Section number (seksjonsnummer)")
     
-    @validator('municipality_code')
+    @field_validator('municipality_code')
+    @classmethod
     def validate_municipality_code(cls, v):
         """Validate that municipality code is in correct format (4 digits)"""
-        if not re.match(r'^\d{4}$', v):
+        if not MUNICIPALITY_CODE_RE.match(v):
             raise ValueError('Municipality code must be 4 digits')
         return v
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "property_id": "property-123",
                 "municipality_code": "0301",
@@ -197,16 +199,17 @@ class PropertyBase(BaseModel):
                 "snr": None
             }
         }
+    )
 
 class PropertyCreate(PropertyBase):
     """Model for creating a new property record"""
     address: Address
     area: float = Field(..., description="Property area in square meters")
     coordinates: Coordinates
-    land_use_category: LandUseCategory = LandUseCategory.RESIDENTIAL
+    land_use_category: LandUseCategory = "bolig"
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "property_id": "property-123",
                 "municipality_code": "0301",
@@ -231,6 +234,7 @@ class PropertyCreate(PropertyBase):
                 "land_use_category": "bolig"
             }
         }
+    )
 
 class PropertyUpdate(BaseModel):
     """Model for updating property information"""
@@ -242,14 +246,27 @@ class PropertyUpdate(BaseModel):
     zoning_status: Optional[ZoningStatus] = None
     zoning_regulations: Optional[List[ZoningRegulation]] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "area": 1200.0,
                 "land_use_category": "kombinert",
                 "zoning_status": "regulert"
             }
         }
+    )
+
+@lru_cache(maxsize=None)
+def _property_update_adapter() -> TypeAdapter:
+    """Build the PropertyUpdate validator once, on first use"""
+    return TypeAdapter(PropertyUpdate)
+
+def validate_property_update(data: Dict[str, Any]) -> PropertyUpdate:
+    """Validate a partial property update payload"""
+    return _property_update_adapter().validate_python(data)
+
+# Allowed rounding error when owner shares are summed to 100%
+OWNERSHIP_SUM_TOLERANCE = 1e-9
 
 class PropertyOwner(BaseModel):
     """Property owner information"""
@@ -259,15 +276,19 @@ class PropertyOwner(BaseModel):
     ownership_percentage: float
     acquisition_date: Optional[datetime] = None
     
-    @validator('ownership_percentage')
+    @field_validator('ownership_percentage')
+    @classmethod
     def validate_percentage(cls, v):
         """Validate that ownership percentage is between 0 and 100"""
         if v < 0 or v > 100:
             raise ValueError('Ownership percentage must be between 0 and 100')
         return v
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        frozen=True,
+        extra='forbid',
+        json_schema_extra={
             "example": {
                 "owner_id": "owner-123",
                 "owner_type": "person",
@@ -276,6 +297,7 @@ class PropertyOwner(BaseModel):
                 "acquisition_date": "2010-01-01T00:00:00Z"
             }
         }
+    )
 
 class PropertyValueAssessment(BaseModel):
     """Property value assessment information"""
@@ -287,8 +309,9 @@ class PropertyValueAssessment(BaseModel):
     assessor_id: Optional[str] = None
     assessor_name: Optional[str] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "assessment_id": "assessment-123",
                 "assessment_date": "2023-01-01T00:00:00Z",
@@ -299,6 +322,7 @@ class PropertyValueAssessment(BaseModel):
                 "assessor_name": "Eiendomsverdi AS"
             }
         }
+    )
 
 class Encumbrance(BaseModel):
     """Legal encumbrances on the property"""
@@ -310,8 +334,9 @@ class Encumbrance(BaseModel):
     beneficiary: Optional[str] = None
     document_url: Optional[str] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "encumbrance_id": "encumbrance-123",
                 "encumbrance_type": "mortgage",
@@ -322,6 +347,7 @@ class Encumbrance(BaseModel):
                 "document_url": "https://example.com/document.pdf"
             }
         }
+    )
 
 class PropertyTransaction(BaseModel):
     """Historical transaction data for the property"""
@@ -335,8 +361,9 @@ class PropertyTransaction(BaseModel):
     seller_name: Optional[str] = None
     document_url: Optional[str] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "transaction_id": "transaction-123",
                 "transaction_date": "2010-01-01T00:00:00Z",
@@ -347,6 +374,7 @@ class PropertyTransaction(BaseModel):
                 "document_url": "https://example.com/document.pdf"
             }
         }
+    )
 
 class DevelopmentPotential(BaseModel):
     """Analysis of development potential for the property"""
@@ -362,8 +390,9 @@ class DevelopmentPotential(BaseModel):
     constraints: Optional[List[str]] = None
     opportunities: Optional[List[str]] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "potential_id": "potential-123",
                 "analysis_date": "2023-01-15T00:00:00Z",
@@ -378,6 +407,7 @@ class DevelopmentPotential(BaseModel):
                 "opportunities": ["økende boligpriser i området", "god kollektivdekning"]
             }
         }
+    )
 
 class Property(PropertyBase):
     """Complete property model with all fields"""
@@ -386,7 +416,7 @@ class Property(PropertyBase):
     coordinates: Coordinates
     land_use_category: LandUseCategory
     buildings: List[Building] = Field(default_factory=list)
-    zoning_status: ZoningStatus = ZoningStatus.UNZONED
+    zoning_status: ZoningStatus = "uregulert"
     zoning_regulations: List[ZoningRegulation] = Field(default_factory=list)
     owners: List[PropertyOwner] = Field(default_factory=list)
     value_assessments: List[PropertyValueAssessment] = Field(default_factory=list)
@@ -399,16 +429,26 @@ class Property(PropertyBase):
     documents: List[Dict[str, str]] = Field(default_factory=list)
     metadata: Dict[str, Any] = Field(default_factory=dict)
     
-    @root_validator(skip_on_failure=True)
-    def validate_owners_percentage(cls, values):
+    @field_validator('owners', mode='after')
+    @classmethod
+    def validate_owners_percentage(cls, v):
         """Validate that sum of ownership percentages is 100%"""
-        owners = values.get('owners', [])
-        if owners and sum(o.ownership_percentage for o in owners) != 100:
+        if not v:
+            return v
+        percentages = []
+        running_total = 0.0
+        for owner in v:
+            running_total += owner.ownership_percentage
+            if running_total > 100.0 + OWNERSHIP_SUM_TOLERANCE:
+                raise ValueError('Sum of ownership percentages must be 100%')
+            percentages.append(owner.ownership_percentage)
+        if abs(math.fsum(percentages) - 100.0) > OWNERSHIP_SUM_TOLERANCE:
             raise ValueError('Sum of ownership percentages must be 100%')
-        return values
+        return v
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "property_id": "property-123",
                 "municipality_code": "0301",
@@ -467,11 +507,77 @@ class Property(PropertyBase):
                 "updated_at": "2023-01-15T00:00:00Z"
             }
         }
+    )
+
+@lru_cache(maxsize=None)
+def _property_list_adapter() -> TypeAdapter:
+    """Build the List[Property] validator once, on first use"""
+    return TypeAdapter(List[Property])
+
+def validate_properties(data: List[Dict[str, Any]]) -> List[Property]:
+    """Validate a batch of raw property records in a single pydantic-core call"""
+    return _property_list_adapter().validate_python(data)
+
+def find_invalid_ownerships(offsets: Sequence[int], percentages: Sequence[float]) -> List[int]:
+    """
+    Check owner shares for a batch of properties in vectorized passes
+    
+    Shares are laid out flat, with property i owning
+    percentages[offsets[i]:offsets[i + 1]]. Properties without owners are valid.
+    
+    Args:
+        offsets: Start index of each property's shares, plus the total count
+        percentages: Ownership percentages for all properties
+        
+    Returns:
+        Indexes of properties with a share outside 0-100 or a sum other than 100%
+    """
+    import numpy as np  # only bulk imports need it
+    
+    offsets = np.asarray(offsets, dtype=np.intp)
+    values = np.asarray(percentages, dtype=np.float64)
+    counts = np.diff(offsets)
+    owned = counts > 0
+    
+    sums = np.zeros(len(counts))
+    if owned.any():
+        sums[owned] = np.add.reduceat(values, offsets[:-1][owned])
+    invalid = owned & (np.abs(sums - 100.0) > OWNERSHIP_SUM_TOLERANCE)
+    
+    out_of_range = np.flatnonzero((values < 0) | (values > 100))
+    invalid[np.searchsorted(offsets, out_of_range, side="right") - 1] = True
+    return np.flatnonzero(invalid).tolist()
+
+# IDs use 4 random bytes each, drawn from one os.urandom batch instead of a uuid4 per call
+ID_ENTROPY_POOL_SIZE = 4096
+_id_entropy = b""
+_id_entropy_offset = 0
+_id_entropy_lock = threading.Lock()
+
+def _reset_id_entropy() -> None:
+    """Drop buffered entropy so forked workers never hand out the parent's IDs"""
+    global _id_entropy, _id_entropy_offset, _id_entropy_lock
+    _id_entropy = b""
+    _id_entropy_offset = 0
+    _id_entropy_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_id_entropy)
+
+def _random_id_hex() -> str:
+    """Return 8 random hex characters from the shared entropy pool"""
+    global _id_entropy, _id_entropy_offset
+    with _id_entropy_lock:
+        if _id_entropy_offset + 4 > len(_id_entropy):
+            _id_entropy = os.urandom(ID_ENTROPY_POOL_SIZE)
+            _id_entropy_offset = 0
+        start = _id_entropy_offset
+        _id_entropy_offset = start + 4
+        return _id_entropy[start:start + 4].hex()
 
 def generate_property_id() -> str:
     """Generate a unique property ID"""
-    return f"property-{uuid.uuid4().hex[:8]}"
+    return f"property-{_random_id_hex()}"
 
 def generate_building_id() -> str:
     """Generate a unique building ID"""
-    return f"building-{uuid.uuid4().hex[:8]}" 
\ No newline at end of file
+    return f"building-{_random_id_hex()}" 
\ No newline at end of file
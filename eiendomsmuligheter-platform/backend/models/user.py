@@ -7,27 +7,42 @@ This module provides data models for user representation, including:
 - User update model
 - User roles and permissions
 """
-from pydantic import BaseModel, EmailStr, validator, Field
+from pydantic import AfterValidator, BaseModel, ConfigDict, EmailStr, Field, field_validator
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Annotated, Optional, List, Dict, Any
 import re
 import uuid
 
+# Norwegian phone numbers, optionally with +47 prefix and grouping spaces
+PHONE_NUMBER_RE = re.compile(r'^\+?(?:47)?[ ]?(?:\d{8}|\d{3}[ ]?\d{2}[ ]?\d{3}|\d{2}[ ]?\d{2}[ ]?\d{2}[ ]?\d{2})$')
+EMAIL_ADDRESS_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+def _check_email_syntax(v: str) -> str:
+    """Validate email address syntax with the precompiled regex"""
+    if not EMAIL_ADDRESS_RE.match(v):
+        raise ValueError('Invalid email address')
+    return v
+
+# Syntax-only email type for stored users and bulk imports; skips email-validator's
+# IDNA normalization. User-supplied addresses keep the strict EmailStr.
+FastEmailStr = Annotated[str, AfterValidator(_check_email_syntax), Field(json_schema_extra={"format": "email"})]
+
 class UserBase(BaseModel):
     """Base model for user data"""
-    email: EmailStr
+    email: FastEmailStr
     full_name: str
     disabled: bool = False
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserCreate(UserBase):
     """Model for user creation with password validation"""
+    email: EmailStr
     password: str = Field(..., min_length=8)
     user_type: str = "user"
     
-    @validator('password')
+    @field_validator('password')
+    @classmethod
     def password_strength(cls, v):
         """Validate password strength"""
         if len(v) < 8:
@@ -40,7 +55,8 @@ class UserCreate(UserBase):
             raise ValueError('Password must contain at least one digit')
         return v
     
-    @validator('user_type')
+    @field_validator('user_type')
+    @classmethod
     def valid_user_type(cls, v):
         """Validate user type"""
         allowed_types = ["user", "partner", "admin", "premium"]
@@ -48,8 +64,8 @@ class UserCreate(UserBase):
             raise ValueError(f'User type must be one of: {", ".join(allowed_types)}')
         return v
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "email": "user@example.com",
                 "full_name": "John Doe",
@@ -58,6 +74,7 @@ class UserCreate(UserBase):
                 "disabled": False
             }
         }
+    )
 
 class UserUpdate(BaseModel):
     """Model for updating user data"""
@@ -66,7 +83,8 @@ class UserUpdate(BaseModel):
     disabled: Optional[bool] = None
     user_type: Optional[str] = None
     
-    @validator('user_type')
+    @field_validator('user_type')
+    @classmethod
     def valid_user_type(cls, v):
         """Validate user type"""
         if v is None:
@@ -76,8 +94,8 @@ class UserUpdate(BaseModel):
             raise ValueError(f'User type must be one of: {", ".join(allowed_types)}')
         return v
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "email": "updated_email@example.com",
                 "full_name": "Updated Name",
@@ -85,6 +103,7 @@ class UserUpdate(BaseModel):
                 "disabled": False
             }
         }
+    )
 
 class User(UserBase):
     """Complete user model with all fields"""
@@ -101,9 +120,9 @@ class User(UserBase):
     saved_properties: List[str] = Field(default_factory=list)
     usage_stats: Dict[str, Any] = Field(default_factory=dict)
     
-    class Config:
-        orm_mode = True
-        schema_extra = {
+    model_config = ConfigDict(
+        from_attributes=True,
+        json_schema_extra={
             "example": {
                 "id": "user-123",
                 "email": "user@example.com",
@@ -129,13 +148,13 @@ class User(UserBase):
                 }
             }
         }
+    )
 
 class UserInDB(User):
     """Database representation of user with hashed password"""
     hashed_password: str
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TokenData(BaseModel):
     """Token data model"""
@@ -153,8 +172,8 @@ class Token(BaseModel):
     user_id: str
     scopes: List[str] = []
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "access_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9...",
                 "token_type": "bearer",
@@ -164,6 +183,7 @@ class Token(BaseModel):
                 "scopes": ["user", "premium"]
             }
         }
+    )
 
 def generate_user_id() -> str:
     """Generate a unique user ID"""
@@ -171,10 +191,18 @@ def generate_user_id() -> str:
 
 def validate_phone_number(phone: str) -> bool:
     """Validate Norwegian phone number format"""
-    pattern = r'^\+?(?:47)?[ ]?(?:\d{8}|\d{3}[ ]?\d{2}[ ]?\d{3}|\d{2}[ ]?\d{2}[ ]?\d{2}[ ]?\d{2})$'
-    return bool(re.match(pattern, phone))
+    return bool(PHONE_NUMBER_RE.match(phone))
 
 def validate_email_address(email: str) -> bool:
     """Validate email address format"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email)) 
\ No newline at end of file
+    return bool(EMAIL_ADDRESS_RE.match(email))
+
+def validate_phone_numbers(phones: List[str]) -> List[bool]:
+    """Validate a batch of Norwegian phone numbers"""
+    match = PHONE_NUMBER_RE.match
+    return [match(phone) is not None for phone in phones]
+
+def validate_email_addresses(emails: List[str]) -> List[bool]:
+    """Validate a batch of email address formats"""
+    match = EMAIL_ADDRESS_RE.match
+    return [match(email) is not None for email in emails]
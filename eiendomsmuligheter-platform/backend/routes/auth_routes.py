@@ -4,16 +4,28 @@ Håndterer brukerregistrering, innlogging, og tokenvalidering.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime, timedelta
 import jwt
-from passlib.context import CryptContext
 import os
-import json
+import asyncio
 import logging
+import sqlite3
+import threading
+from cachetools import TTLCache
+
+# Tokens og passordhasher lages av middleware, med samme nøkkel og bcrypt-oppsett
+try:
+    from middleware.auth import create_access_token, decode_token, get_password_hash, verify_password
+    from routes.responses import model_response
+except ImportError:
+    # Fallback for direkte import
+    from backend.middleware.auth import create_access_token, decode_token, get_password_hash, verify_password
+    from backend.routes.responses import model_response
 
 # Oppsett av logging
 logger = logging.getLogger(__name__)
@@ -22,27 +34,29 @@ logger = logging.getLogger(__name__)
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
+    default_response_class=ORJSONResponse,
     responses={
         404: {"description": "Not found"}
     }
 )
 
-# JWT-konfigurasjon
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "hemmelig_nøkkel_som_bør_endres_i_produksjon")
-ALGORITHM = "HS256"
+# JWT-konfigurasjon; nøkkel og algoritme hentes fra middleware (SECRET_KEY)
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 timer
 
 # Sikkerhetskonfigurasjon
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 # Datamodeller
 class Token(BaseModel):
     access_token: str
     token_type: str
+    
+    model_config = ConfigDict(frozen=True)
 
 class TokenData(BaseModel):
     username: str
+    
+    model_config = ConfigDict(frozen=True)
 
 class UserBase(BaseModel):
     username: str
@@ -59,57 +73,110 @@ class User(UserBase):
     class Config:
         orm_mode = True
 
-# Simulert brukerdatabase (i produksjon ville dette være koblet til en database)
-users_db = {
-    "testuser": {
-        "id": 1,
-        "username": "testuser",
-        "email": "test@example.com",
-        "full_name": "Test Bruker",
-        "hashed_password": pwd_context.hash("testuser"),
-        "is_active": True
-    },
-    "admin": {
-        "id": 2,
-        "username": "admin",
-        "email": "admin@example.com",
-        "full_name": "Admin Bruker",
-        "hashed_password": pwd_context.hash("adminpassword"),
-        "is_active": True
-    }
-}
+# Brukerdatabase i SQLite (WAL), slik at brukere overlever omstart.
+# Demobrukerne legges inn ved oppstart i en egen tråd, slik at verken import
+# eller event-loopen må vente på bcrypt-hashing.
+AUTH_DB_PATH = os.getenv("AUTH_DB_PATH", "./auth_users.db")
+_DEMO_USERS = [
+    (1, "testuser", "test@example.com", "Test Bruker", "testuser"),
+    (2, "admin", "admin@example.com", "Admin Bruker", "adminpassword"),
+]
+_CREATE_USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL UNIQUE,
+        email TEXT,
+        full_name TEXT,
+        hashed_password TEXT NOT NULL,
+        is_active INTEGER NOT NULL DEFAULT 1
+    )
+"""
+# Faste SQL-strenger gjenbrukes fra sqlite3 sin statement-cache uten ny parsing
+_SELECT_USER = "SELECT id, username, email, full_name, hashed_password, is_active FROM users WHERE username = ?"
+_INSERT_USER = "INSERT INTO users (username, email, full_name, hashed_password, is_active) VALUES (?, ?, ?, ?, ?)"
+_SEED_USER = "INSERT OR IGNORE INTO users (id, username, email, full_name, hashed_password, is_active) VALUES (?, ?, ?, ?, ?, 1)"
+
+_users_conn: Optional[sqlite3.Connection] = None
+_users_lock = threading.Lock()
+
+# Kortlevd cache av kjente brukere; is_active og passordhash leses på nytt etter TTL
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60  # sekunder
+_user_cache: TTLCache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+def get_users_db() -> sqlite3.Connection:
+    global _users_conn
+    if _users_conn is None:
+        with _users_lock:
+            if _users_conn is None:
+                conn = sqlite3.connect(AUTH_DB_PATH, check_same_thread=False, isolation_level=None)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(_CREATE_USERS_TABLE)
+                _users_conn = conn
+    return _users_conn
+
+def _fetch_user_row(username: str) -> Optional[sqlite3.Row]:
+    db = get_users_db()
+    with _users_lock:
+        return db.execute(_SELECT_USER, (username,)).fetchone()
+
+def _seed_demo_users():
+    db = get_users_db()
+    for user_id, username, email, full_name, password in _DEMO_USERS:
+        # Hash bare brukere som mangler, så omstart ikke betaler bcrypt på nytt
+        if _fetch_user_row(username) is None:
+            hashed_password = get_password_hash(password)
+            with _users_lock:
+                db.execute(_SEED_USER, (user_id, username, email, full_name, hashed_password))
+    _clear_user_cache()
+
+async def _seed_demo_users_on_startup():
+    # bcrypt er CPU-tungt; kjør i en tråd så event-loopen ikke blokkeres
+    await asyncio.to_thread(_seed_demo_users)
+
+router.add_event_handler("startup", _seed_demo_users_on_startup)
 
 # Hjelpefunksjoner
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def _clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def _get_user_cached(username: str):
+    # Validert User og passordhash i ett oppslag; tømmes når brukertabellen endres
+    with _user_cache_lock:
+        cached = _user_cache.get(username)
+    if cached is not None:
+        return cached
+    row = _fetch_user_row(username)
+    if row is None:
+        # Ukjente brukernavn caches ikke, så nye brukere blir synlige med en gang
+        return None, None
+    user = User(
+        id=row["id"],
+        username=row["username"],
+        email=row["email"],
+        full_name=row["full_name"],
+        is_active=bool(row["is_active"])
+    )
+    with _user_cache_lock:
+        _user_cache[username] = (user, row["hashed_password"])
+    return user, row["hashed_password"]
 
 def get_user(username: str):
-    if username in users_db:
-        user_dict = users_db[username]
-        return User(**user_dict)
-    return None
+    return _get_user_cached(username)[0]
 
-def authenticate_user(username: str, password: str):
-    user = get_user(username)
+async def authenticate_user(username: str, password: str):
+    user, hashed_password = _get_user_cached(username)
     if not user:
         return False
-    if not verify_password(password, users_db[username]["hashed_password"]):
+    # bcrypt er CPU-tungt; kjør i en tråd så event-loopen ikke blokkeres
+    if not await asyncio.to_thread(verify_password, password, hashed_password):
         return False
     return user
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -117,7 +184,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -130,7 +197,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
-    if not users_db[current_user.username]["is_active"]:
+    if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inaktiv bruker")
     return current_user
 
@@ -138,7 +205,7 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     logger.info(f"Innloggingsforsøk for bruker: {form_data.username}")
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         logger.warning(f"Innloggingsforsøk mislyktes for bruker: {form_data.username}")
         raise HTTPException(
@@ -151,40 +218,41 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
     logger.info(f"Vellykket innlogging for bruker: {form_data.username}")
-    return {"access_token": access_token, "token_type": "bearer"}
+    return model_response(Token(access_token=access_token, token_type="bearer"))
 
 @router.get("/users/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
-    return current_user
+    return model_response(current_user)
 
 @router.post("/users/", response_model=User)
 async def create_user(user: UserCreate):
-    if user.username in users_db:
+    # bcrypt er CPU-tungt; hash i en tråd før innsetting
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
+    db = get_users_db()
+    
+    # Legg til ny bruker i databasen; UNIQUE på username avviser duplikater
+    try:
+        with _users_lock:
+            # SQLite tildeler id atomisk (INTEGER PRIMARY KEY)
+            user_id = db.execute(
+                _INSERT_USER,
+                (user.username, user.email, user.full_name, hashed_password, int(user.is_active))
+            ).lastrowid
+    except sqlite3.IntegrityError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Brukernavn er allerede i bruk",
         )
-    
-    hashed_password = get_password_hash(user.password)
-    user_id = len(users_db) + 1
-    
-    # Legg til ny bruker i databasen
-    users_db[user.username] = {
-        "id": user_id,
-        "username": user.username,
-        "email": user.email,
-        "full_name": user.full_name,
-        "hashed_password": hashed_password,
-        "is_active": user.is_active
-    }
+    _clear_user_cache()
     
     logger.info(f"Ny bruker opprettet: {user.username}")
-    return User(**users_db[user.username])
+    return model_response(User(id=user_id, **user.model_dump(exclude={"password"})))
 
 @router.get("/status")
 async def auth_status(current_user: User = Depends(get_current_active_user)):
-    return {
+    # orjson skriver datetime selv; ferdig respons hopper over jsonable_encoder
+    return ORJSONResponse({
         "status": "authenticated",
         "user": current_user.username,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+        "timestamp": datetime.utcnow()
+    })
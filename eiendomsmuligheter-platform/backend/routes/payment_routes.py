@@ -9,17 +9,28 @@ This module provides endpoints for payment processing, including:
 - Webhook processing
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Body, Request, Response, Header
-from fastapi.responses import JSONResponse, RedirectResponse
-from typing import Dict, List, Optional, Any, Union
-from pydantic import BaseModel, Field, EmailStr
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Set, Tuple, Union
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, TypeAdapter
+from functools import lru_cache
+from secrets import token_hex
+from redis.exceptions import ResponseError
+from cachetools import TTLCache
+import asyncio
+import contextlib
+import hashlib
 import logging
 import json
+import orjson
 import os
+import socket
+import time
 from datetime import datetime
 
 # Import custom modules
 try:
-    from middleware.auth import get_current_active_user, get_premium_user, get_admin_user, User
+    from middleware.auth import get_current_active_user, get_premium_user, get_admin_user, get_redis, User
+    from routes.responses import model_response, list_response
     from services.payment import (
         payment_service, 
         Customer, 
@@ -31,7 +42,8 @@ try:
     )
 except ImportError:
     # Fallback for direct imports
-    from backend.middleware.auth import get_current_active_user, get_premium_user, get_admin_user, User
+    from backend.middleware.auth import get_current_active_user, get_premium_user, get_admin_user, get_redis, User
+    from backend.routes.responses import model_response, list_response
     from backend.services.payment import (
         payment_service, 
         Customer, 
@@ -49,6 +61,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter(
     prefix="/api/payments",
     tags=["payments"],
+    default_response_class=ORJSONResponse,
     responses={
         status.HTTP_404_NOT_FOUND: {"description": "Not found"},
         status.HTTP_400_BAD_REQUEST: {"description": "Bad request"},
@@ -63,13 +76,14 @@ class CreateCustomerRequest(BaseModel):
     name: str
     email: EmailStr
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "name": "Ola Nordmann",
                 "email": "ola.nordmann@example.com"
             }
         }
+    )
 
 class CheckoutSessionRequest(BaseModel):
     """Request model for creating a checkout session"""
@@ -79,8 +93,8 @@ class CheckoutSessionRequest(BaseModel):
     cancel_url: Optional[str] = None
     metadata: Dict[str, str] = Field(default_factory=dict)
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "product_id": "premium",
                 "subscription_period": "monthly",
@@ -91,14 +105,15 @@ class CheckoutSessionRequest(BaseModel):
                 }
             }
         }
+    )
 
 class PaymentIntentRequest(BaseModel):
     """Request model for creating a payment intent"""
     product_id: str
     metadata: Dict[str, str] = Field(default_factory=dict)
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "product_id": "3d_model",
                 "metadata": {
@@ -106,19 +121,21 @@ class PaymentIntentRequest(BaseModel):
                 }
             }
         }
+    )
 
 class CancelSubscriptionRequest(BaseModel):
     """Request model for canceling a subscription"""
     subscription_id: str
     at_period_end: bool = True
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "subscription_id": "sub_123456789",
                 "at_period_end": True
             }
         }
+    )
 
 class ProductResponse(BaseModel):
     """Response model for product information"""
@@ -130,8 +147,8 @@ class ProductResponse(BaseModel):
     price_yearly: Optional[int] = None
     price: Optional[int] = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "id": "premium",
                 "name": "Premium abonnement",
@@ -147,11 +164,111 @@ class ProductResponse(BaseModel):
                 "price_yearly": 2990
             }
         }
+    )
+
+# User -> Stripe customer mapping, shared by all workers through Redis.
+# A local TTL cache in front serves repeat lookups without a Redis round-trip.
+# Redis may evict keys under memory pressure, so a miss there is confirmed
+# against the user_id metadata on the Stripe customers before creating one.
+CUSTOMER_KEY_PREFIX = "cust:"
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "10000"))
+CUSTOMER_CACHE_TTL = int(os.getenv("CUSTOMER_CACHE_TTL", "3600"))  # seconds
+_customer_cache: TTLCache = TTLCache(maxsize=CUSTOMER_CACHE_SIZE, ttl=CUSTOMER_CACHE_TTL)
+# Without Redis this worker's copy is the only one, so it is never evicted
+_local_customer_ids: Dict[str, str] = {}
+
+def _cached_customer_id(user_id: str) -> Optional[str]:
+    """Get a customer ID known to this worker"""
+    return _customer_cache.get(user_id) or _local_customer_ids.get(user_id)
+
+def _customer_store_unavailable(user_id: str, error: Any) -> HTTPException:
+    """Log a failed customer lookup and build the error for the request"""
+    logger.error("Failed to look up customer for user %s: %s", user_id, error)
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Payment customer lookup is temporarily unavailable"
+    )
+
+async def _store_customer_id(user_id: str, customer_id: str) -> str:
+    """
+    Record a user's customer ID in Redis and the local cache.
+    
+    Args:
+        user_id: ID of the user
+        customer_id: Stripe customer ID to record
+        
+    Returns:
+        The recorded customer ID; if another worker stored one first, that one
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        _local_customer_ids[user_id] = customer_id
+        return customer_id
+    
+    key = CUSTOMER_KEY_PREFIX + user_id
+    try:
+        if not await redis_client.set(key, customer_id, nx=True):
+            existing = await redis_client.get(key)
+            if existing is not None:
+                customer_id = existing.decode("utf-8")
+    except Exception as e:
+        # The customer metadata in Stripe still has the mapping
+        logger.error("Failed to store customer for user %s: %s", user_id, e)
+    
+    _customer_cache[user_id] = customer_id
+    return customer_id
+
+# Customer details (including payment methods) per customer ID, kept briefly to
+# spare a Stripe round-trip when the same customer is fetched repeatedly
+CUSTOMER_DETAILS_CACHE_SIZE = 50000
+CUSTOMER_DETAILS_CACHE_TTL = 60  # seconds
+_customer_details: TTLCache = TTLCache(maxsize=CUSTOMER_DETAILS_CACHE_SIZE, ttl=CUSTOMER_DETAILS_CACHE_TTL)
 
-# Mock customer database (in a real app, this would be in a database)
-CUSTOMER_DB = {}
+def invalidate_customer(customer_id: str) -> None:
+    """Drop cached details for a customer that changed"""
+    _customer_details.pop(customer_id, None)
+
+async def lookup_customer_id(user_id: str) -> Optional[str]:
+    """
+    Look up an existing Stripe customer ID for a user without creating one.
+    
+    Args:
+        user_id: ID of the user
+        
+    Returns:
+        Stripe customer ID, or None if the user is not a customer yet
+        
+    Raises:
+        HTTPException: 503 if Redis or Stripe can't be reached, since the
+            user may already be a customer
+    """
+    customer_id = _cached_customer_id(user_id)
+    if customer_id is not None:
+        return customer_id
+    
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            stored = await redis_client.get(CUSTOMER_KEY_PREFIX + user_id)
+        except Exception as e:
+            raise _customer_store_unavailable(user_id, e)
+        if stored is not None:
+            customer_id = stored.decode("utf-8")
+            _customer_cache[user_id] = customer_id
+            return customer_id
+    
+    # Not in Redis (never stored, or evicted): ask Stripe
+    customer_id, error = await payment_service.find_customer_id_async(user_id)
+    if error is not None:
+        raise _customer_store_unavailable(user_id, error)
+    if customer_id is None:
+        return None
+    return await _store_customer_id(user_id, customer_id)
 
 # Get or create customer ID for a user
+# Locks serializing customer creation per user, dropped once the customer exists
+_create_locks: Dict[str, asyncio.Lock] = {}
+
 async def get_customer_id(user: User) -> str:
     """
     Get or create a Stripe customer ID for a user.
@@ -163,38 +280,105 @@ async def get_customer_id(user: User) -> str:
         Stripe customer ID
     """
     # Check if user already has a customer ID
-    if user.id in CUSTOMER_DB:
-        return CUSTOMER_DB[user.id]
+    customer_id = await lookup_customer_id(user.id)
+    if customer_id is not None:
+        return customer_id
+    
+    # Only one request per user creates the customer; concurrent ones wait for it
+    lock = _create_locks.get(user.id)
+    if lock is None:
+        lock = _create_locks[user.id] = asyncio.Lock()
+    async with lock:
+        try:
+            customer_id = await lookup_customer_id(user.id)
+            if customer_id is not None:
+                return customer_id
+            
+            # Create new customer
+            customer, error = await payment_service.create_customer_async(
+                email=user.email,
+                name=user.full_name,
+                user_id=user.id
+            )
+            if error is not None:
+                logger.error("Failed to create customer for user %s: %s", user.id, error)
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to create payment customer"
+                )
+            
+            # Store customer ID; if another worker stored one first, use theirs
+            customer_id = await _store_customer_id(user.id, customer.id)
+            if customer_id != customer.id:
+                logger.warning("Customer for user %s was created concurrently; using stored ID", user.id)
+            return customer_id
+        finally:
+            if _create_locks.get(user.id) is lock:
+                del _create_locks[user.id]
+
+# Per-user cap on in-flight Stripe-heavy requests. Each request holds a slot in a
+# sorted set scored by start time; slots older than the TTL are treated as leaked.
+CONCURRENT_REQUEST_LIMIT = int(os.getenv("PAYMENT_CONCURRENT_LIMIT", "5"))
+CONCURRENT_REQUEST_TTL = 60  # seconds
+
+_ACQUIRE_SLOT_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1] - ARGV[2])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+@lru_cache(maxsize=1)
+def _acquire_slot_script():
+    """Register the slot script on the shared client once"""
+    return get_redis().register_script(_ACQUIRE_SLOT_LUA)
+
+async def enforce_concurrent_limit(current_user: User = Depends(get_current_active_user)):
+    """
+    Limit how many expensive payment requests a user can have in flight.
     
-    # Create new customer
+    Args:
+        current_user: The authenticated user
+        
+    Raises:
+        HTTPException: 429 if the user already has the maximum number in flight
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        yield
+        return
+    
+    key = f"concurrent:{current_user.id}"
+    request_id = token_hex(8)
     try:
-        customer = payment_service.create_customer(
-            email=user.email,
-            name=user.full_name,
-            user_id=user.id
+        acquired = await _acquire_slot_script()(
+            keys=[key],
+            args=[time.time(), CONCURRENT_REQUEST_TTL, CONCURRENT_REQUEST_LIMIT, request_id]
         )
-        
-        # Store customer ID
-        CUSTOMER_DB[user.id] = customer.id
-        
-        return customer.id
-    except ValueError as e:
-        logger.error(f"Failed to create customer for user {user.id}: {str(e)}")
+    except Exception as e:
+        logger.error("Failed to check concurrent requests for user %s: %s", current_user.id, e)
+        yield  # Fail open if Redis is unavailable
+        return
+    
+    if not acquired:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create payment customer"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many concurrent payment requests",
+            headers={"Retry-After": "1"}
         )
+    try:
+        yield
+    finally:
+        try:
+            await redis_client.zrem(key, request_id)
+        except Exception as e:
+            logger.error("Failed to release concurrent request slot for user %s: %s", current_user.id, e)
 
-# Routes
-@router.get("/products", response_model=List[ProductResponse])
-async def list_products(
-    current_user: User = Depends(get_current_active_user)
-):
-    """
-    List available products and pricing.
-    
-    This endpoint returns a list of available subscription plans and one-time purchase options.
-    """
+def _build_products_response() -> List[Dict[str, Any]]:
+    """Build the product listing, validated once against ProductResponse"""
     products = []
     
     for product_id, product_data in PRODUCTS.items():
@@ -214,10 +398,31 @@ async def list_products(
             # One-time products
             product["price"] = product_data["price_amount"]
         
-        products.append(product)
+        products.append(ProductResponse(**product).model_dump())
     
     return products
 
+# The catalogue is static, so the response body is built and serialized once at import
+_PRODUCTS_RESPONSE = _build_products_response()
+_PRODUCTS_RESPONSE_BYTES = orjson.dumps(_PRODUCTS_RESPONSE)
+
+# List responses are serialized by pydantic-core through these adapters
+_SUBSCRIPTION_LIST_ADAPTER = TypeAdapter(List[Subscription])
+_INVOICE_LIST_ADAPTER = TypeAdapter(List[Invoice])
+
+# Routes
+@router.get("/products", response_model=List[ProductResponse])
+async def list_products(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    List available products and pricing.
+    
+    This endpoint returns a list of available subscription plans and one-time purchase options.
+    """
+    # Returned as ready bytes, so FastAPI neither re-validates nor re-encodes it per request
+    return Response(content=_PRODUCTS_RESPONSE_BYTES, media_type="application/json")
+
 @router.post("/customers", response_model=Customer)
 async def create_customer(
     request: CreateCustomerRequest,
@@ -229,19 +434,18 @@ async def create_customer(
     This endpoint is primarily used by administrators to create customers.
     Normal users are automatically registered as customers when making their first payment.
     """
-    try:
-        customer = payment_service.create_customer(
-            email=request.email,
-            name=request.name
-        )
-        
-        return customer
-    except ValueError as e:
-        logger.error(f"Failed to create customer: {str(e)}")
+    customer, error = await payment_service.create_customer_async(
+        email=request.email,
+        name=request.name
+    )
+    if error is not None:
+        logger.error("Failed to create customer: %s", error)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create customer: {str(e)}"
+            detail=f"Failed to create customer: {error}"
         )
+    
+    return model_response(customer)
 
 @router.get("/customers/me", response_model=Customer)
 async def get_current_customer(
@@ -253,22 +457,24 @@ async def get_current_customer(
     This endpoint returns the authenticated user's payment customer information,
     including saved payment methods.
     """
-    try:
-        # Get or create customer ID
-        customer_id = await get_customer_id(current_user)
-        
-        # Get customer details
-        customer = payment_service.get_customer(customer_id)
-        
-        return customer
-    except ValueError as e:
-        logger.error(f"Failed to get customer for user {current_user.id}: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to get customer information: {str(e)}"
-        )
+    # Get or create customer ID
+    customer_id = await get_customer_id(current_user)
+    
+    # Get customer details, reusing a recent fetch
+    customer = _customer_details.get(customer_id)
+    if customer is None:
+        customer, error = await payment_service.get_customer_async(customer_id)
+        if error is not None:
+            logger.error("Failed to get customer for user %s: %s", current_user.id, error)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to get customer information: {error}"
+            )
+        _customer_details[customer.id] = customer
+    
+    return model_response(customer)
 
-@router.post("/checkout", response_model=Dict[str, Any])
+@router.post("/checkout", response_model=Dict[str, Any], dependencies=[Depends(enforce_concurrent_limit)])
 async def create_checkout_session(
     request: CheckoutSessionRequest,
     current_user: User = Depends(get_current_active_user)
@@ -279,32 +485,31 @@ async def create_checkout_session(
     This endpoint creates a Stripe checkout session and returns the session URL
     that the client should redirect to.
     """
-    try:
-        # Get or create customer ID
-        customer_id = await get_customer_id(current_user)
-        
-        # Create checkout session
-        checkout_session = payment_service.create_checkout_session(
-            customer_id=customer_id,
-            product_id=request.product_id,
-            subscription_period=request.subscription_period,
-            success_url=request.success_url,
-            cancel_url=request.cancel_url,
-            metadata={
-                "user_id": current_user.id,
-                **request.metadata
-            }
-        )
-        
-        return checkout_session
-    except ValueError as e:
-        logger.error(f"Failed to create checkout session: {str(e)}")
+    # Get or create customer ID
+    customer_id = await get_customer_id(current_user)
+    
+    # Create checkout session
+    checkout_session, error = await payment_service.create_checkout_session_async(
+        customer_id=customer_id,
+        product_id=request.product_id,
+        subscription_period=request.subscription_period,
+        success_url=request.success_url,
+        cancel_url=request.cancel_url,
+        metadata={
+            "user_id": current_user.id,
+            **request.metadata
+        }
+    )
+    if error is not None:
+        logger.error("Failed to create checkout session: %s", error)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Failed to create checkout session: {str(e)}"
+            detail=f"Failed to create checkout session: {error}"
         )
+    
+    return checkout_session
 
-@router.post("/payment-intents", response_model=PaymentIntent)
+@router.post("/payment-intents", response_model=PaymentIntent, dependencies=[Depends(enforce_concurrent_limit)])
 async def create_payment_intent(
     request: PaymentIntentRequest,
     current_user: User = Depends(get_current_active_user)
@@ -315,27 +520,32 @@ async def create_payment_intent(
     This endpoint creates a Stripe payment intent and returns the client secret
     that the client can use to complete the payment.
     """
-    try:
-        # Get or create customer ID
-        customer_id = await get_customer_id(current_user)
-        
-        # Create payment intent
-        payment_intent = payment_service.create_payment_intent(
-            customer_id=customer_id,
-            product_id=request.product_id,
-            metadata={
-                "user_id": current_user.id,
-                **request.metadata
-            }
-        )
-        
-        return payment_intent
-    except ValueError as e:
-        logger.error(f"Failed to create payment intent: {str(e)}")
+    # Get or create customer ID
+    customer_id = await get_customer_id(current_user)
+    
+    # Create payment intent
+    payment_intent, error = await payment_service.create_payment_intent_async(
+        customer_id=customer_id,
+        product_id=request.product_id,
+        metadata={
+            "user_id": current_user.id,
+            **request.metadata
+        }
+    )
+    if error is not None:
+        logger.error("Failed to create payment intent: %s", error)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Failed to create payment intent: {str(e)}"
+            detail=f"Failed to create payment intent: {error}"
         )
+    
+    return model_response(payment_intent)
+
+@lru_cache(maxsize=4096)
+def _mock_subscription_id(user_id: str) -> str:
+    """Demo subscription ID that is the same in every worker process"""
+    digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest()
+    return f"sub_{int.from_bytes(digest, 'big') % 1000000}"
 
 @router.get("/subscriptions", response_model=List[Subscription])
 async def list_subscriptions(
@@ -350,14 +560,15 @@ async def list_subscriptions(
     # For this demo, we return mock data
     
     # Check if user has a customer ID
-    if current_user.id not in CUSTOMER_DB:
+    customer_id = await lookup_customer_id(current_user.id)
+    if customer_id is None:
         return []
     
     # Mock data
     subscriptions = [
         Subscription(
-            id=f"sub_{hash(current_user.id) % 1000000}",
-            customer_id=CUSTOMER_DB[current_user.id],
+            id=_mock_subscription_id(current_user.id),
+            customer_id=customer_id,
             product_id="premium",
             price_id="price_monthly_premium",
             status="active",
@@ -368,7 +579,7 @@ async def list_subscriptions(
         )
     ]
     
-    return subscriptions
+    return list_response(_SUBSCRIPTION_LIST_ADAPTER, subscriptions)
 
 @router.get("/subscriptions/{subscription_id}", response_model=Subscription)
 async def get_subscription(
@@ -380,27 +591,28 @@ async def get_subscription(
     
     This endpoint returns detailed information about a specific subscription.
     """
-    try:
-        # Get subscription details
-        subscription = payment_service.get_subscription(subscription_id)
-        
-        # Verify that the subscription belongs to the user
-        customer_id = await get_customer_id(current_user)
-        if subscription.customer_id != customer_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You do not have access to this subscription"
-            )
-        
-        return subscription
-    except ValueError as e:
-        logger.error(f"Failed to get subscription {subscription_id}: {str(e)}")
+    # Get subscription details and the user's customer ID concurrently
+    (subscription, error), customer_id = await asyncio.gather(
+        payment_service.get_subscription_async(subscription_id),
+        get_customer_id(current_user)
+    )
+    if error is not None:
+        logger.error("Failed to get subscription %s: %s", subscription_id, error)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Failed to get subscription: {str(e)}"
+            detail=f"Failed to get subscription: {error}"
         )
+    
+    # Verify that the subscription belongs to the user
+    if subscription.customer_id != customer_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this subscription"
+        )
+    
+    return model_response(subscription)
 
-@router.post("/subscriptions/cancel", response_model=Subscription)
+@router.post("/subscriptions/cancel", response_model=Subscription, dependencies=[Depends(enforce_concurrent_limit)])
 async def cancel_subscription(
     request: CancelSubscriptionRequest,
     current_user: User = Depends(get_current_active_user)
@@ -410,31 +622,39 @@ async def cancel_subscription(
     
     This endpoint cancels a subscription, either immediately or at the end of the current billing period.
     """
-    try:
-        # Get subscription details first to verify ownership
-        subscription = payment_service.get_subscription(request.subscription_id)
-        
-        # Verify that the subscription belongs to the user
-        customer_id = await get_customer_id(current_user)
-        if subscription.customer_id != customer_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You do not have access to this subscription"
-            )
-        
-        # Cancel subscription
-        updated_subscription = payment_service.cancel_subscription(
-            subscription_id=request.subscription_id,
-            at_period_end=request.at_period_end
+    # Get subscription details and the user's customer ID concurrently to verify ownership
+    (subscription, error), customer_id = await asyncio.gather(
+        payment_service.get_subscription_async(request.subscription_id),
+        get_customer_id(current_user)
+    )
+    
+    if error is not None:
+        logger.error("Failed to cancel subscription %s: %s", request.subscription_id, error)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to cancel subscription: {error}"
         )
-        
-        return updated_subscription
-    except ValueError as e:
-        logger.error(f"Failed to cancel subscription {request.subscription_id}: {str(e)}")
+    
+    # Verify that the subscription belongs to the user
+    if subscription.customer_id != customer_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this subscription"
+        )
+    
+    # Cancel subscription
+    updated_subscription, error = await payment_service.cancel_subscription_async(
+        subscription_id=request.subscription_id,
+        at_period_end=request.at_period_end
+    )
+    if error is not None:
+        logger.error("Failed to cancel subscription %s: %s", request.subscription_id, error)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Failed to cancel subscription: {str(e)}"
+            detail=f"Failed to cancel subscription: {error}"
         )
+    
+    return model_response(updated_subscription)
 
 @router.get("/invoices", response_model=List[Invoice])
 async def list_invoices(
@@ -446,23 +666,229 @@ async def list_invoices(
     
     This endpoint returns a list of the authenticated user's invoices.
     """
-    try:
-        # Get or create customer ID
-        customer_id = await get_customer_id(current_user)
-        
-        # List invoices
-        invoices = payment_service.list_invoices(
-            customer_id=customer_id,
-            limit=limit
-        )
-        
-        return invoices
-    except ValueError as e:
-        logger.error(f"Failed to list invoices: {str(e)}")
+    # Get or create customer ID
+    customer_id = await get_customer_id(current_user)
+    
+    # List invoices
+    invoices, error = await payment_service.list_invoices_async(
+        customer_id=customer_id,
+        limit=limit
+    )
+    if error is not None:
+        logger.error("Failed to list invoices: %s", error)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to list invoices: {str(e)}"
+            detail=f"Failed to list invoices: {error}"
         )
+    
+    return list_response(_INVOICE_LIST_ADAPTER, invoices)
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Handlers per Stripe event type; all handlers for an event run concurrently
+EVENT_HANDLERS: Dict[str, List[EventHandler]] = {}
+_NO_HANDLERS: Tuple[EventHandler, ...] = ()
+
+def on_event(*event_types: str) -> Callable[[EventHandler], EventHandler]:
+    """
+    Register a webhook handler for one or more Stripe event types.
+    
+    Args:
+        event_types: Stripe event types the handler should receive
+        
+    Returns:
+        Decorator that registers and returns the handler unchanged
+    """
+    def register(handler: EventHandler) -> EventHandler:
+        for event_type in event_types:
+            EVENT_HANDLERS.setdefault(event_type, []).append(handler)
+        return handler
+    return register
+
+# Webhook event handlers
+@on_event("checkout.session.completed")
+async def handle_checkout_completed(event_data: Dict[str, Any]) -> None:
+    """Handle successful checkout"""
+    # In a real app, we would update the user's subscription status
+    pass
+
+@on_event("invoice.paid")
+async def handle_invoice_paid(event_data: Dict[str, Any]) -> None:
+    """Handle paid invoice"""
+    # In a real app, we would update subscription status
+    pass
+
+@on_event("customer.subscription.updated")
+async def handle_subscription_updated(event_data: Dict[str, Any]) -> None:
+    """Handle subscription update"""
+    # In a real app, we would update subscription status
+    pass
+
+@on_event("customer.subscription.deleted")
+async def handle_subscription_deleted(event_data: Dict[str, Any]) -> None:
+    """Handle subscription deletion"""
+    # In a real app, we would update subscription status
+    pass
+
+@on_event("customer.updated", "customer.deleted")
+async def handle_customer_changed(event_data: Dict[str, Any]) -> None:
+    """Handle customer update or deletion"""
+    customer_id = (event_data.get("data") or {}).get("id")
+    if customer_id:
+        invalidate_customer(customer_id)
+
+# Strong references to running dispatches, so they are not garbage collected mid-flight
+_webhook_tasks: Set[asyncio.Task] = set()
+
+async def dispatch_event(event_data: Dict[str, Any]) -> None:
+    """
+    Run every handler registered for a webhook event concurrently.
+    
+    Args:
+        event_data: Verified Stripe event
+    """
+    event_type = event_data.get("type")
+    handlers = EVENT_HANDLERS.get(event_type, _NO_HANDLERS)
+    results = await asyncio.gather(*(handler(event_data) for handler in handlers), return_exceptions=True)
+    for handler, result in zip(handlers, results):
+        if isinstance(result, Exception):
+            logger.error("Webhook handler %s failed for event %s: %s", handler.__name__, event_data.get('id'), result)
+
+# Verified webhook events are queued on a Redis stream and processed by a
+# background consumer in each worker, so the endpoint only pays for verification
+WEBHOOK_STREAM = os.getenv("WEBHOOK_STREAM", "stripe:events")
+WEBHOOK_GROUP = "webhook-workers"
+WEBHOOK_STREAM_MAXLEN = int(os.getenv("WEBHOOK_STREAM_MAXLEN", "100000"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+WEBHOOK_BLOCK_MS = 5000
+WEBHOOK_CLAIM_IDLE_MS = 60000  # events left unacknowledged this long by a dead consumer are taken over
+WEBHOOK_WORKER_ENABLED = os.getenv("WEBHOOK_WORKER_ENABLED", "true").lower() == "true"
+
+_webhook_worker: Optional[asyncio.Task] = None
+
+# Stripe retries deliveries it did not see acknowledged in time; event IDs that
+# were already accepted are remembered for a day so retries are not reprocessed
+WEBHOOK_EVENT_KEY_PREFIX = "evt:"
+WEBHOOK_DEDUP_TTL = 86400  # seconds
+
+async def claim_event(event_id: str) -> bool:
+    """
+    Mark a webhook event as accepted unless it already was.
+    
+    Args:
+        event_id: Stripe event ID
+        
+    Returns:
+        True if this is the first delivery of the event (or Redis is unavailable),
+        False for a duplicate
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return True
+    try:
+        return bool(await redis_client.set(WEBHOOK_EVENT_KEY_PREFIX + event_id, b"1", nx=True, ex=WEBHOOK_DEDUP_TTL))
+    except Exception as e:
+        logger.error("Failed to check webhook event %s for duplicates: %s", event_id, e)
+        return True
+
+async def enqueue_event(event_data: Dict[str, Any]) -> bool:
+    """
+    Queue a verified webhook event for the background consumers.
+    
+    Args:
+        event_data: Verified Stripe event
+        
+    Returns:
+        True if the event was queued, False if the consumers are disabled or
+        Redis is unavailable
+    """
+    # With the consumers disabled nothing would ever read the stream
+    if not WEBHOOK_WORKER_ENABLED:
+        return False
+    redis_client = get_redis()
+    if redis_client is None:
+        return False
+    try:
+        await redis_client.xadd(
+            WEBHOOK_STREAM,
+            {"event": orjson.dumps(event_data, default=str)},
+            maxlen=WEBHOOK_STREAM_MAXLEN,
+            approximate=True
+        )
+        return True
+    except Exception as e:
+        logger.error("Failed to queue webhook event %s: %s", event_data.get('id'), e)
+        return False
+
+async def _process_event_batch(redis_client, entries: List[Tuple[bytes, Dict[bytes, bytes]]]) -> None:
+    """Dispatch a batch of queued events concurrently and acknowledge them together"""
+    events = []
+    for entry_id, fields in entries:
+        try:
+            events.append(orjson.loads(fields[b"event"]))
+        except (KeyError, orjson.JSONDecodeError) as e:
+            logger.error("Dropping malformed webhook stream entry %r: %s", entry_id, e)
+    await asyncio.gather(*(dispatch_event(event_data) for event_data in events))
+    await redis_client.xack(WEBHOOK_STREAM, WEBHOOK_GROUP, *(entry_id for entry_id, _ in entries))
+
+async def run_webhook_worker(consumer: str) -> None:
+    """
+    Consume queued webhook events until cancelled.
+    
+    Args:
+        consumer: Name of this consumer within the consumer group
+    """
+    redis_client = get_redis()
+    group_ready = False
+    while True:
+        try:
+            if not group_ready:
+                try:
+                    await redis_client.xgroup_create(WEBHOOK_STREAM, WEBHOOK_GROUP, id="0", mkstream=True)
+                except ResponseError as e:
+                    if "BUSYGROUP" not in str(e):
+                        raise
+                group_ready = True
+            
+            response = await redis_client.xreadgroup(
+                WEBHOOK_GROUP, consumer, {WEBHOOK_STREAM: ">"},
+                count=WEBHOOK_BATCH_SIZE, block=WEBHOOK_BLOCK_MS
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                # Idle: take over events a crashed consumer never acknowledged
+                _, entries, _ = await redis_client.xautoclaim(
+                    WEBHOOK_STREAM, WEBHOOK_GROUP, consumer,
+                    min_idle_time=WEBHOOK_CLAIM_IDLE_MS, count=WEBHOOK_BATCH_SIZE
+                )
+            if entries:
+                await _process_event_batch(redis_client, entries)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Webhook worker error: %s", e)
+            await asyncio.sleep(1)
+
+async def start_webhook_worker() -> None:
+    """Start this process's webhook consumer if Redis is configured"""
+    global _webhook_worker
+    if not WEBHOOK_WORKER_ENABLED or get_redis() is None:
+        return
+    if _webhook_worker is None or _webhook_worker.done():
+        consumer = f"{socket.gethostname()}-{os.getpid()}"
+        _webhook_worker = asyncio.create_task(run_webhook_worker(consumer))
+
+async def stop_webhook_worker() -> None:
+    """Stop this process's webhook consumer"""
+    global _webhook_worker
+    if _webhook_worker is not None:
+        _webhook_worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _webhook_worker
+        _webhook_worker = None
+
+router.add_event_handler("startup", start_webhook_worker)
+router.add_event_handler("shutdown", stop_webhook_worker)
 
 @router.post("/webhook", status_code=status.HTTP_200_OK)
 async def webhook(
@@ -472,40 +898,31 @@ async def webhook(
     """
     Handle Stripe webhook events.
     
-    This endpoint receives and processes webhook events from Stripe,
-    such as successful payments, subscription updates, etc.
+    This endpoint verifies webhook events from Stripe, such as successful payments
+    and subscription updates, queues them and acknowledges them right away. The
+    event handlers run in the background so slow side effects do not hold up
+    Stripe's delivery.
     """
     try:
-        # Get request body
-        payload = await request.body()
-        
-        # Verify webhook signature and process event
-        event_data = payment_service.handle_webhook(payload, stripe_signature)
-        
-        # Process event based on type
-        event_type = event_data.get("type")
+        # Verify webhook signature while the body streams in, then process the event
+        event_data = await payment_service.verify_webhook_stream(request.stream(), stripe_signature)
         
-        if event_type == "checkout.session.completed":
-            # Handle successful checkout
-            # In a real app, we would update the user's subscription status
-            pass
-        elif event_type == "invoice.paid":
-            # Handle paid invoice
-            # In a real app, we would update subscription status
-            pass
-        elif event_type == "customer.subscription.updated":
-            # Handle subscription update
-            # In a real app, we would update subscription status
-            pass
-        elif event_type == "customer.subscription.deleted":
-            # Handle subscription deletion
-            # In a real app, we would update subscription status
-            pass
+        event_id = event_data.get("id")
+        if EVENT_HANDLERS.get(event_data.get("type")):
+            # Skip retried deliveries of an event that was already accepted
+            if event_id and not await claim_event(event_id):
+                return {"status": "duplicate", "event_id": event_id}
+            
+            # Queue the event for the consumers; without them or Redis, dispatch it in this process
+            if not await enqueue_event(event_data):
+                task = asyncio.create_task(dispatch_event(event_data))
+                _webhook_tasks.add(task)
+                task.add_done_callback(_webhook_tasks.discard)
         
-        return {"status": "success", "event_id": event_data.get("id")}
+        return {"status": "success", "event_id": event_id}
     except ValueError as e:
-        logger.error(f"Failed to process webhook: {str(e)}")
-        return JSONResponse(
+        logger.error("Failed to process webhook: %s", e)
+        return ORJSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={"error": str(e)}
         )
\ No newline at end of file
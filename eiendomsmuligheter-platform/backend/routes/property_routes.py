@@ -3,17 +3,24 @@ Property routes for the eiendomsmuligheter platform.
 Handles property information, analysis, 3D visualization, etc.
 """
 
-from fastapi import APIRouter, HTTPException, Depends, status, Query, Body, File, UploadFile, Path
-from typing import List, Optional, Dict, Any, Union
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Body, File, UploadFile, Path, Request, Response
+from typing import List, NamedTuple, Optional, Dict, Any, Tuple, Union
+from itertools import islice
 from pydantic import BaseModel, Field, constr, validator
 from datetime import datetime
+import asyncio
+import bisect
+import hashlib
 import json
 import os
 import logging
-import random
+import re
 import shutil
+import traceback
 from pathlib import Path as FilePath
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from secrets import token_hex
+from cachetools import TTLCache
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, ORJSONResponse
 
 # Import Models
 from models.property import PropertyBase, PropertyCreate, PropertyUpdate
@@ -32,11 +39,22 @@ router = APIRouter(
     prefix="/properties",
     tags=["properties"],
     responses={404: {"description": "Not found"}},
+    default_response_class=ORJSONResponse,
 )
 
-# Initialize AI modules
-alterra_ml = AlterraML()
-commune_connect = CommuneConnect()
+# AI module singletons, created once per worker at startup
+alterra_ml: Optional[AlterraML] = None
+commune_connect: Optional[CommuneConnect] = None
+
+async def _init_ai_modules():
+    """Load the AI modules when the application starts rather than at import"""
+    global alterra_ml, commune_connect
+    if alterra_ml is None:
+        alterra_ml = AlterraML()
+    if commune_connect is None:
+        commune_connect = CommuneConnect()
+
+router.add_event_handler("startup", _init_ai_modules)
 
 # Mock Property Database
 mock_properties = {
@@ -90,9 +108,113 @@ mock_properties = {
     }
 }
 
-# AI Module Singletons
-alterra_ml = AlterraML()
-commune_connect = CommuneConnect()
+# Property IDs kept sorted by area (ascending) and by creation time (oldest first),
+# so listing slices an index instead of copying and sorting every property
+def _area_key(property_id: str) -> float:
+    return mock_properties[property_id]["area"]
+
+def _created_key(property_id: str) -> str:
+    return mock_properties[property_id]["created_at"]
+
+_sorted_by_area: List[str] = sorted(mock_properties, key=_area_key)
+_sorted_by_date: List[str] = sorted(mock_properties, key=_created_key)
+
+# Lowercased search fields per property, computed on write so searches only compare
+class _SearchTerms(NamedTuple):
+    address: str
+    land_use_name: str
+    land_use_code: str
+    building_types: Tuple[Tuple[str, str], ...]  # (lowercased name, code) per building
+
+def _building_type_terms(building: Dict[str, Any]) -> Tuple[str, str]:
+    building_type = building.get("building_type")
+    if not isinstance(building_type, dict):
+        return "", ""
+    return str(building_type.get("name") or "").lower(), str(building_type.get("code") or "")
+
+def _search_terms(property_dict: Dict[str, Any]) -> _SearchTerms:
+    # Stored properties come from loosely typed dicts, so missing fields match nothing
+    land_use = property_dict.get("land_use_category") or {}
+    return _SearchTerms(
+        address=str(property_dict.get("address") or "").lower(),
+        land_use_name=str(land_use.get("name") or "").lower(),
+        land_use_code=str(land_use.get("code") or ""),
+        building_types=tuple(
+            _building_type_terms(b) for b in property_dict.get("buildings") or [] if isinstance(b, dict)
+        )
+    )
+
+_search_index: Dict[str, _SearchTerms] = {
+    property_id: _search_terms(property_dict) for property_id, property_dict in mock_properties.items()
+}
+
+# Property IDs per municipality code (dicts used as insertion-ordered sets), so a
+# search filtered on municipality only visits that municipality's properties
+_by_municipality: Dict[str, Dict[str, None]] = {}
+
+def _index_municipality(property_id: str) -> None:
+    _by_municipality.setdefault(mock_properties[property_id]["municipality_code"], {})[property_id] = None
+
+def _unindex_municipality(property_id: str) -> None:
+    code = mock_properties[property_id]["municipality_code"]
+    members = _by_municipality[code]
+    del members[property_id]
+    if not members:
+        del _by_municipality[code]
+
+for _property_id in mock_properties:
+    _index_municipality(_property_id)
+
+def _index_property(property_id: str, terms: _SearchTerms) -> None:
+    """Add a stored property to the sort and search indexes, given its precomputed search terms"""
+    bisect.insort(_sorted_by_area, property_id, key=_area_key)
+    bisect.insort(_sorted_by_date, property_id, key=_created_key)
+    _search_index[property_id] = terms
+    _index_municipality(property_id)
+
+def _unindex_property(property_id: str) -> None:
+    """Remove a property from the sort and search indexes while it is still stored"""
+    _sorted_by_area.remove(property_id)
+    _sorted_by_date.remove(property_id)
+    del _search_index[property_id]
+    _unindex_municipality(property_id)
+
+# Municipal regulations change over months, so lookups are cached per
+# (address, municipality) for a day. A lock per key makes concurrent misses
+# for the same property share one upstream lookup.
+REGULATIONS_CACHE_SIZE = 10_000
+REGULATIONS_CACHE_TTL = 86400  # seconds
+_regulations_cache: TTLCache = TTLCache(maxsize=REGULATIONS_CACHE_SIZE, ttl=REGULATIONS_CACHE_TTL)
+_regulations_locks: Dict[Tuple[str, Optional[str]], asyncio.Lock] = {}
+
+async def get_cached_regulations(address: str, municipality_id: Optional[str]) -> Dict[str, Any]:
+    """Get regulations for a property, from the cache when possible"""
+    key = (address, municipality_id)
+    regulations = _regulations_cache.get(key)
+    if regulations is not None:
+        return regulations
+    
+    lock = _regulations_locks.get(key)
+    if lock is None:
+        lock = _regulations_locks[key] = asyncio.Lock()
+    async with lock:
+        try:
+            regulations = _regulations_cache.get(key)
+            if regulations is None:
+                # CommuneConnect may call the municipal API, so it runs in a worker thread
+                regulations = await asyncio.to_thread(
+                    commune_connect.get_property_regulations,
+                    address=address,
+                    municipality_id=municipality_id
+                )
+                _regulations_cache[key] = regulations
+            return regulations
+        finally:
+            if _regulations_locks.get(key) is lock:
+                del _regulations_locks[key]
+
+# Norwegian municipality codes are exactly four ASCII digits
+MUNICIPALITY_CODE_RE = re.compile(r"[0-9]{4}")
 
 # Request and Response Models
 class PropertyRequest(BaseModel):
@@ -106,7 +228,7 @@ class PropertyRequest(BaseModel):
     
     @validator('municipality_code')
     def validate_municipality_code(cls, v):
-        if v is not None and (not v.isdigit() or len(v) != 4):
+        if v is not None and not MUNICIPALITY_CODE_RE.fullmatch(v):
             raise ValueError('Municipality code must be a 4-digit number')
         return v
 
@@ -191,23 +313,25 @@ async def get_properties(
     start = (page - 1) * size
     end = start + size
     
-    properties_list = list(mock_properties.values())
-    
-    # Sorting logic could be added here
-    if sort_by:
-        if sort_by == "area":
-            properties_list.sort(key=lambda x: x["area"])
-        elif sort_by == "date":
-            properties_list.sort(key=lambda x: x["created_at"], reverse=True)
+    # Slice the requested page from the matching index
+    if sort_by == "area":
+        page_ids = _sorted_by_area[start:end]
+    elif sort_by == "date":
+        # Newest first: take the page from the end of the oldest-first index
+        total = len(_sorted_by_date)
+        page_ids = _sorted_by_date[max(total - end, 0):max(total - start, 0)][::-1]
+    else:
+        page_ids = list(islice(mock_properties, start, end))
     
-    paginated_properties = properties_list[start:end]
+    paginated_properties = [mock_properties[property_id] for property_id in page_ids]
     
-    return {
+    # The stored properties are already validated; return them without another model pass
+    return ORJSONResponse({
         "properties": paginated_properties,
-        "total": len(properties_list),
+        "total": len(mock_properties),
         "page": page,
         "size": size
-    }
+    })
 
 @router.get("/{property_id}", response_model=PropertyDetail)
 async def get_property(
@@ -220,7 +344,7 @@ async def get_property(
     if not property_exists(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
-    return mock_properties[property_id]
+    return ORJSONResponse(mock_properties[property_id])
 
 @router.post("/", response_model=PropertyDetail, status_code=status.HTTP_201_CREATED)
 async def create_property(
@@ -251,7 +375,12 @@ async def create_property(
         "updated_at": timestamp
     }
     
+    # Anything that can fail runs before the indexes are touched
+    terms = _search_terms(new_property)
+    if property_id in mock_properties:
+        _unindex_property(property_id)
     mock_properties[property_id] = new_property
+    _index_property(property_id, terms)
     
     return new_property
 
@@ -269,13 +398,22 @@ async def update_property(
     
     property_dict = mock_properties[property_id]
     
-    # Update only the fields that are provided
-    update_data = property_data.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        if value is not None:
-            property_dict[key] = value
+    # Update only the fields that are provided with a value
+    update_data = property_data.model_dump(exclude_unset=True, exclude_none=True)
     
+    # Anything that can fail runs before the property and its indexes are touched
+    terms = _search_terms({**property_dict, **update_data})
+    if "area" in update_data:
+        _sorted_by_area.remove(property_id)
+    if "municipality_code" in update_data:
+        _unindex_municipality(property_id)
+    property_dict.update(update_data)
     property_dict["updated_at"] = datetime.now().isoformat()
+    if "area" in update_data:
+        bisect.insort(_sorted_by_area, property_id, key=_area_key)
+    if "municipality_code" in update_data:
+        _index_municipality(property_id)
+    _search_index[property_id] = terms
     
     return property_dict
 
@@ -290,6 +428,7 @@ async def delete_property(
     if not property_exists(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
+    _unindex_property(property_id)
     del mock_properties[property_id]
     
     return None
@@ -312,8 +451,8 @@ async def analyze_property(
         floor_area_ratio=property_request.current_utilization if property_request.current_utilization else None
     )
     
-    # Get analysis result from AlterraML
-    analysis_result = alterra_ml.analyze_property(property_data)
+    # Get analysis result from AlterraML in a worker thread so the event loop keeps serving
+    analysis_result = await asyncio.to_thread(alterra_ml.analyze_property, property_data)
     
     # Return formatted response
     return analysis_result
@@ -331,10 +470,10 @@ async def get_property_regulations(
     
     property_data = mock_properties[property_id]
     
-    # Get regulations from CommuneConnect
-    regulations = commune_connect.get_property_regulations(
-        address=property_data["address"],
-        municipality_id=property_data["municipality_code"]
+    # Get regulations from the cache, or from CommuneConnect on a miss
+    regulations = await get_cached_regulations(
+        property_data["address"],
+        property_data["municipality_code"]
     )
     
     return {
@@ -353,43 +492,49 @@ async def search_properties(
     """
     Search for properties based on various criteria.
     """
-    filtered_properties = list(mock_properties.values())
-    
-    # Apply filters based on search parameters
-    if search_params.address:
-        filtered_properties = [p for p in filtered_properties if search_params.address.lower() in p["address"].lower()]
-    
-    if search_params.municipality_code:
-        filtered_properties = [p for p in filtered_properties if p["municipality_code"] == search_params.municipality_code]
-    
-    if search_params.min_area is not None:
-        filtered_properties = [p for p in filtered_properties if p["area"] >= search_params.min_area]
-    
-    if search_params.max_area is not None:
-        filtered_properties = [p for p in filtered_properties if p["area"] <= search_params.max_area]
-    
-    if search_params.land_use_category:
-        filtered_properties = [p for p in filtered_properties if 
-                            p["land_use_category"]["name"].lower() == search_params.land_use_category.lower() or
-                            p["land_use_category"]["code"] == search_params.land_use_category]
-    
-    if search_params.building_type:
-        filtered_properties = [p for p in filtered_properties if 
-                            any(b["building_type"]["name"].lower() == search_params.building_type.lower() or
-                                b["building_type"]["code"] == search_params.building_type
-                                for b in p["buildings"])]
+    # Lowercase the search parameters once; empty strings do not filter
+    address = search_params.address.lower() if search_params.address else None
+    municipality_code = search_params.municipality_code or None
+    min_area = search_params.min_area
+    max_area = search_params.max_area
+    land_use = search_params.land_use_category or None
+    land_use_lc = land_use.lower() if land_use else None
+    building_type = search_params.building_type or None
+    building_type_lc = building_type.lower() if building_type else None
+    
+    # Narrow the candidates with the municipality index when possible
+    if municipality_code is None:
+        candidate_ids = mock_properties.keys()
+    else:
+        candidate_ids = _by_municipality.get(municipality_code, {}).keys()
+    
+    # Apply the remaining filters lazily in a single pass
+    matches = (
+        p for property_id in candidate_ids
+        if (p := mock_properties[property_id])
+        and (terms := _search_index[property_id])
+        and (address is None or address in terms.address)
+        and (min_area is None or p["area"] >= min_area)
+        and (max_area is None or p["area"] <= max_area)
+        and (land_use is None or terms.land_use_name == land_use_lc or terms.land_use_code == land_use)
+        and (building_type is None or any(
+            name == building_type_lc or code == building_type
+            for name, code in terms.building_types
+        ))
+    )
     
-    # Paginate results
+    # Paginate results: only the requested page is collected, the rest is only counted
     start = (page - 1) * size
-    end = start + size
-    paginated_properties = filtered_properties[start:end]
+    skipped = sum(1 for _ in islice(matches, start))
+    paginated_properties = list(islice(matches, size))
+    total = skipped + len(paginated_properties) + sum(1 for _ in matches)
     
-    return {
+    return ORJSONResponse({
         "properties": paginated_properties,
-        "total": len(filtered_properties),
+        "total": total,
         "page": page,
         "size": size
-    }
+    })
 
 @router.get("/{property_id}/models", response_model=List[Dict[str, Any]])
 async def get_property_models(
@@ -429,7 +574,8 @@ async def generate_property_model(
     if not property_exists(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
-    model_id = f"model_{random.randint(1000, 9999)}"
+    # 64 random bits from os.urandom: unique across workers without a shared lock
+    model_id = f"model_{token_hex(8)}"
     
     # In a real implementation, this would trigger a background job to generate the model
     # For this demo, we'll return a mock response
@@ -470,22 +616,8 @@ async def get_property_model(
         "view_url": f"/api/properties/{property_id}/models/{model_id}/view"
     }
 
-@router.get("/{property_id}/models/{model_id}/view")
-async def view_3d_model(
-    property_id: str,
-    model_id: str,
-    current_user: Optional[User] = Depends(get_current_active_user)
-):
-    """
-    View a 3D model in the browser.
-    """
-    if not property_exists(property_id):
-        raise HTTPException(status_code=404, detail="Property not found")
-    
-    # In a real implementation, this would return HTML or redirect to a viewer
-    # For this demo, we'll return a mock HTML content
-    
-    html_content = f"""
+# Viewer page, formatted with the property and model IDs per request
+_VIEWER_HTML_TEMPLATE = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -509,13 +641,72 @@ async def view_3d_model(
     </body>
     </html>
     """
+
+@router.get("/{property_id}/models/{model_id}/view")
+async def view_3d_model(
+    property_id: str,
+    model_id: str,
+    current_user: Optional[User] = Depends(get_current_active_user)
+):
+    """
+    View a 3D model in the browser.
+    """
+    if not property_exists(property_id):
+        raise HTTPException(status_code=404, detail="Property not found")
+    
+    # In a real implementation, this would return HTML or redirect to a viewer
+    # For this demo, we'll return a mock HTML content
+    
+    html_content = _VIEWER_HTML_TEMPLATE.format(property_id=property_id, model_id=model_id)
     
     return HTMLResponse(content=html_content, status_code=200)
 
+def _stat_file(path: str) -> Optional[os.stat_result]:
+    """Stat a file, or None if it does not exist"""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+def _file_etag(stat_result: os.stat_result) -> str:
+    """ETag derived from a file's modification time and size"""
+    digest = hashlib.blake2b(f"{stat_result.st_mtime_ns}-{stat_result.st_size}".encode("ascii"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an ETag against an If-None-Match header, as for GET requests"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(","))
+
+async def _conditional_file_response(
+    request: Request,
+    path: str,
+    media_type: str,
+    not_found_detail: str,
+    filename: Optional[str] = None
+) -> Response:
+    """Serve a file with an ETag, or 304 Not Modified when the client already has it"""
+    stat_result = await asyncio.to_thread(_stat_file, path)
+    if stat_result is None:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    
+    # Unchanged files are not sent again
+    headers = {"ETag": _file_etag(stat_result)}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # FileResponse streams the file in chunks through a worker thread
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result)
+
 @router.get("/{property_id}/models/{model_id}/download")
 async def download_3d_model(
     property_id: str,
     model_id: str,
+    request: Request,
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -527,17 +718,19 @@ async def download_3d_model(
     # In a real implementation, this would check if the model exists and return the file
     # For this demo, we'll redirect to a static file
     
-    # Check if the file exists in the public directory
-    model_path = f"../frontend/public/models/properties/{property_id}.json"
-    if os.path.exists(model_path):
-        return FileResponse(model_path, filename=f"{property_id}_3d_model.json")
-    else:
-        raise HTTPException(status_code=404, detail="Model file not found")
+    return await _conditional_file_response(
+        request,
+        f"../frontend/public/models/properties/{property_id}.json",
+        media_type="application/json",
+        not_found_detail="Model file not found",
+        filename=f"{property_id}_3d_model.json"
+    )
 
 @router.get("/{property_id}/models/{model_id}/preview")
 async def preview_3d_model(
     property_id: str,
     model_id: str,
+    request: Request,
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
     """
@@ -549,7 +742,12 @@ async def preview_3d_model(
     # In a real implementation, this would return a preview image
     # For this demo, we'll redirect to a static image
     
-    return FileResponse("../frontend/public/images/property-hero.jpg", media_type="image/jpeg")
+    return await _conditional_file_response(
+        request,
+        "../frontend/public/images/property-hero.jpg",
+        media_type="image/jpeg",
+        not_found_detail="Preview image not found"
+    )
 
 @router.get("/{property_id}/rental-potential", response_model=Dict[str, Any])
 async def analyze_rental_potential(
@@ -587,7 +785,8 @@ async def analyze_rental_potential(
         # Hent eiendomsdata
         property_data = mock_properties[property_id]
         
-        # Initialiser FloorPlanAnalyzer
+        # Initialiser FloorPlanAnalyzer; importeres her siden den drar inn OpenCV
+        from services.floor_plan_analysis import FloorPlanAnalyzer
         floor_plan_analyzer = FloorPlanAnalyzer()
         
         # Samle nødvendig informasjon for analyse
@@ -625,7 +824,7 @@ async def analyze_rental_potential(
                     floor_plan_data=floor_plan_analysis
                 )
                 visualization_url = visualization.get("model_url")
-        except Exception as e:
+            except Exception as e:
                 logger.error(f"Feil ved generering av 3D-visualisering: {str(e)}")
         
         # Bygg responsen
@@ -636,7 +835,7 @@ async def analyze_rental_potential(
             "floor_plan_analysis": {
                 "total_area": floor_plan_analysis.get("total_area", 0),
                 "layout_efficiency": floor_plan_analysis.get("layout_efficiency", 0),
-                "rooms_summary": self._summarize_rooms(floor_plan_analysis.get("rooms_detected", {}))
+                "rooms_summary": _summarize_rooms(floor_plan_analysis.get("rooms_detected", {}))
             },
             "rental_potential": floor_plan_analysis.get("rental_potential", {
                 "has_potential": False,
@@ -648,6 +847,8 @@ async def analyze_rental_potential(
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Feil under analyse av utleiepotensial: {str(e)}")
         logger.debug(traceback.format_exc())
@@ -656,7 +857,7 @@ async def analyze_rental_potential(
             detail=f"En feil oppstod under analyseprosessen: {str(e)}"
         )
 
-def _summarize_rooms(self, rooms_detected):
+def _summarize_rooms(rooms_detected):
     """Opprett en oppsummering av rommene for enklere visning."""
     room_types = {}
     total_area = 0
@@ -0,0 +1,18 @@
+"""
+Shared response helpers for the API routes.
+
+Route results are serialized directly by pydantic-core. FastAPI returns a ready
+Response as-is, so response_model only documents the schema and the result is
+not run through jsonable_encoder and validated a second time.
+"""
+from typing import Any, List
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+def model_response(model: BaseModel) -> Response:
+    """Serialize a response model straight to a JSON response"""
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
+def list_response(adapter: TypeAdapter, items: List[Any]) -> Response:
+    """Serialize a list of response models straight to a JSON response"""
+    return Response(content=adapter.dump_json(items), media_type="application/json")
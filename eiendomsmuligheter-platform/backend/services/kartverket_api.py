@@ -91,8 +91,8 @@ class KartverketAPI:
         Raises:
             KartverketAPIError: If the API request fails
         """
-        # Rate limiting
-        current_time = time.time()
+        # Rate limiting (monotonic clock, so wall-clock adjustments don't affect it)
+        current_time = time.monotonic()
         time_since_last_request = current_time - self.last_request_time
         if time_since_last_request < 1.0 / self.config["rate_limit"]:
             time.sleep(1.0 / self.config["rate_limit"] - time_since_last_request)
@@ -104,11 +104,10 @@ class KartverketAPI:
             cache_key = hashlib.md5(json.dumps(cache_components).encode()).hexdigest()
             
             # Check cache
-            if cache_key in self.cache:
-                cache_entry = self.cache[cache_key]
-                if current_time - cache_entry["timestamp"] < self.config["cache_timeout"]:
-                    logger.debug(f"Cache hit for {endpoint}")
-                    return cache_entry["data"]
+            cache_entry = self.cache.get(cache_key)
+            if cache_entry is not None and current_time < cache_entry["expires"]:
+                logger.debug(f"Cache hit for {endpoint}")
+                return cache_entry["data"]
         
         # Prepare request
         url = urljoin(self.config[base_url_key], endpoint)
@@ -126,7 +125,7 @@ class KartverketAPI:
                     headers=request_headers,
                     timeout=self.config["timeout"]
                 )
-                self.last_request_time = time.time()
+                self.last_request_time = time.monotonic()
                 
                 # Check for HTTP errors
                 response.raise_for_status()
@@ -147,7 +146,7 @@ class KartverketAPI:
                 if use_cache and method.upper() == 'GET' and cache_key:
                     self.cache[cache_key] = {
                         "data": response_data,
-                        "timestamp": time.time()
+                        "expires": self.last_request_time + self.config["cache_timeout"]
                     }
                 
                 return response_data
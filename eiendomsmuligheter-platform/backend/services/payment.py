@@ -9,11 +9,20 @@ This module provides integration with Stripe for:
 - Webhooks for payment events
 """
 import os
+import asyncio
+import hashlib
+import hmac
 import logging
-from typing import Dict, List, Optional, Any, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple, Union
 from datetime import datetime, timedelta
+import requests
 import stripe
+from requests.adapters import HTTPAdapter
 import json
+import orjson
 import uuid
 from enum import Enum
 from pydantic import BaseModel, Field
@@ -27,6 +36,66 @@ STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "whsec_your_webhook_s
 
 stripe.api_key = STRIPE_API_KEY
 
+# Blocking Stripe SDK calls from async code run on a dedicated, bounded pool so
+# they cannot starve the default executor used by the rest of the application
+STRIPE_THREAD_POOL_SIZE = int(os.getenv("STRIPE_THREAD_POOL_SIZE", "32"))
+_stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_THREAD_POOL_SIZE, thread_name_prefix="stripe")
+
+# All Stripe worker threads share one keep-alive connection pool, sized for the
+# Stripe thread pool, so calls reuse warm TLS connections instead of each thread
+# opening its own. Stripe requests carry no cookies, so sharing the session is safe.
+STRIPE_HTTP_TIMEOUT = float(os.getenv("STRIPE_HTTP_TIMEOUT", "30"))
+
+_stripe_session = requests.Session()
+_stripe_session.mount("https://", HTTPAdapter(pool_maxsize=STRIPE_THREAD_POOL_SIZE))
+stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_HTTP_TIMEOUT, session=_stripe_session)
+
+# Outcome of a Stripe call made from async code: (value, None) on success or
+# (None, error message) when the call failed. Failures are expected under load,
+# so they are returned to the route instead of raised across the thread boundary.
+Result = Tuple[Optional[Any], Optional[str]]
+
+def _capture(func, *args, **kwargs) -> Result:
+    """Call func, turning a ValueError from the Stripe wrappers into an error Result"""
+    try:
+        return func(*args, **kwargs), None
+    except ValueError as e:
+        return None, str(e)
+
+async def _run_blocking(func, *args, **kwargs) -> Result:
+    """Run a blocking Stripe call on the Stripe thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_stripe_executor, partial(_capture, func, *args, **kwargs))
+
+# Maximum age of a webhook signature timestamp, same default as the Stripe SDK
+WEBHOOK_TOLERANCE = 300  # seconds
+
+def _parse_signature_header(header: Optional[str]) -> Tuple[int, List[str]]:
+    """
+    Split a Stripe-Signature header into its timestamp and v1 signatures.
+    
+    Args:
+        header: Stripe signature header, e.g. "t=1700000000,v1=abc..."
+        
+    Returns:
+        Tuple of (timestamp, v1 signatures)
+        
+    Raises:
+        ValueError: If the header is missing or malformed
+    """
+    timestamp = None
+    signatures = []
+    for item in (header or "").split(","):
+        key, _, value = item.strip().partition("=")
+        if key == "t" and value.isdigit():
+            timestamp = int(value)
+        elif key == "v1":
+            signatures.append(value)
+    if timestamp is None or not signatures:
+        logger.error("Invalid webhook signature: malformed Stripe-Signature header")
+        raise ValueError("Invalid webhook signature")
+    return timestamp, signatures
+
 # Product and pricing configuration
 PRODUCTS = {
     "premium": {
@@ -194,6 +263,27 @@ class PaymentService:
             logger.error(f"Failed to create customer: {str(e)}")
             raise ValueError(f"Failed to create customer: {str(e)}")
     
+    @staticmethod
+    def find_customer_id(user_id: str) -> Optional[str]:
+        """
+        Find the Stripe customer created for a user by its user_id metadata.
+        
+        Args:
+            user_id: User ID stored in the customer metadata by create_customer
+            
+        Returns:
+            Stripe customer ID, or None if no customer has been created for the user
+        """
+        # Values in Stripe search queries are single-quoted with backslash escapes
+        quoted = user_id.replace("\\", "\\\\").replace("'", "\\'")
+        try:
+            result = stripe.Customer.search(query=f"metadata['user_id']:'{quoted}'", limit=1)
+        except stripe.error.StripeError as e:
+            logger.error(f"Failed to search customer for user {user_id}: {str(e)}")
+            raise ValueError(f"Failed to search customer: {str(e)}")
+        
+        return result.data[0].id if result.data else None
+    
     @staticmethod
     def get_customer(customer_id: str) -> Customer:
         """
@@ -522,6 +612,53 @@ class PaymentService:
             logger.error(f"Failed to list invoices for customer {customer_id}: {str(e)}")
             raise ValueError(f"Failed to list invoices: {str(e)}")
     
+    # Async variants for route handlers: the Stripe calls run in a worker thread so
+    # independent calls can be awaited together without blocking the event loop.
+    # They return a (value, error) Result instead of raising ValueError.
+    @staticmethod
+    async def create_customer_async(email: str, name: Optional[str] = None, user_id: Optional[str] = None) -> Tuple[Optional[Customer], Optional[str]]:
+        """Create a customer without blocking the event loop"""
+        return await _run_blocking(PaymentService.create_customer, email, name, user_id)
+    
+    @staticmethod
+    async def find_customer_id_async(user_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """Find a user's Stripe customer ID without blocking the event loop"""
+        return await _run_blocking(PaymentService.find_customer_id, user_id)
+    
+    @staticmethod
+    async def get_customer_async(customer_id: str) -> Tuple[Optional[Customer], Optional[str]]:
+        """Get customer details without blocking the event loop"""
+        return await _run_blocking(PaymentService.get_customer, customer_id)
+    
+    @staticmethod
+    async def create_checkout_session_async(customer_id: str, product_id: str, **kwargs: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Create a checkout session without blocking the event loop"""
+        return await _run_blocking(PaymentService.create_checkout_session, customer_id, product_id, **kwargs)
+    
+    @staticmethod
+    async def create_payment_intent_async(
+        customer_id: str,
+        product_id: str,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> Tuple[Optional[PaymentIntent], Optional[str]]:
+        """Create a payment intent without blocking the event loop"""
+        return await _run_blocking(PaymentService.create_payment_intent, customer_id, product_id, metadata)
+    
+    @staticmethod
+    async def get_subscription_async(subscription_id: str) -> Tuple[Optional[Subscription], Optional[str]]:
+        """Get subscription details without blocking the event loop"""
+        return await _run_blocking(PaymentService.get_subscription, subscription_id)
+    
+    @staticmethod
+    async def cancel_subscription_async(subscription_id: str, at_period_end: bool = True) -> Tuple[Optional[Subscription], Optional[str]]:
+        """Cancel a subscription without blocking the event loop"""
+        return await _run_blocking(PaymentService.cancel_subscription, subscription_id, at_period_end)
+    
+    @staticmethod
+    async def list_invoices_async(customer_id: str, limit: int = 10) -> Tuple[Optional[List[Invoice]], Optional[str]]:
+        """List invoices for a customer without blocking the event loop"""
+        return await _run_blocking(PaymentService.list_invoices, customer_id, limit)
+    
     @staticmethod
     def handle_webhook(payload: bytes, signature: str) -> Dict[str, Any]:
         """
@@ -536,79 +673,11 @@ class PaymentService:
         """
         try:
             # Verify webhook signature
-            event = stripe.Webhook.construct_event(
-                payload, signature, STRIPE_WEBHOOK_SECRET
+            stripe.WebhookSignature.verify_header(
+                payload.decode("utf-8") if isinstance(payload, bytes) else payload,
+                signature, STRIPE_WEBHOOK_SECRET, WEBHOOK_TOLERANCE
             )
-            
-            # Process different event types
-            event_data = {
-                "id": event.id,
-                "type": event.type,
-                "created": datetime.fromtimestamp(event.created),
-                "data": event.data.object,
-                "processed": True,
-                "processing_result": {}
-            }
-            
-            if event.type == "checkout.session.completed":
-                # Handle successful checkout
-                session = event.data.object
-                customer_id = session.customer
-                metadata = session.metadata
-                
-                event_data["processing_result"] = {
-                    "customer_id": customer_id,
-                    "product_id": metadata.get("product_id"),
-                    "subscription_period": metadata.get("subscription_period"),
-                    "is_subscription": session.mode == "subscription"
-                }
-                
-                # In a real app, we would update the user's subscription status in our database
-                
-            elif event.type == "invoice.paid":
-                # Handle paid invoice
-                invoice = event.data.object
-                customer_id = invoice.customer
-                subscription_id = invoice.subscription
-                
-                event_data["processing_result"] = {
-                    "customer_id": customer_id,
-                    "subscription_id": subscription_id,
-                    "amount": invoice.total,
-                    "currency": invoice.currency
-                }
-                
-                # In a real app, we would update the user's subscription status in our database
-                
-            elif event.type == "customer.subscription.updated":
-                # Handle subscription update
-                subscription = event.data.object
-                customer_id = subscription.customer
-                
-                event_data["processing_result"] = {
-                    "customer_id": customer_id,
-                    "subscription_id": subscription.id,
-                    "status": subscription.status,
-                    "cancel_at_period_end": subscription.cancel_at_period_end
-                }
-                
-                # In a real app, we would update the user's subscription status in our database
-                
-            elif event.type == "customer.subscription.deleted":
-                # Handle subscription cancellation
-                subscription = event.data.object
-                customer_id = subscription.customer
-                
-                event_data["processing_result"] = {
-                    "customer_id": customer_id,
-                    "subscription_id": subscription.id,
-                    "status": subscription.status
-                }
-                
-                # In a real app, we would update the user's subscription status in our database
-            
-            logger.info(f"Processed webhook event: {event.id}, type: {event.type}")
-            return event_data
+            return PaymentService._process_event(orjson.loads(payload))
             
         except stripe.error.SignatureVerificationError as e:
             logger.error(f"Invalid webhook signature: {str(e)}")
@@ -616,6 +685,131 @@ class PaymentService:
         except Exception as e:
             logger.error(f"Error processing webhook: {str(e)}")
             raise ValueError(f"Error processing webhook: {str(e)}")
+    
+    @staticmethod
+    async def verify_webhook_stream(chunks: AsyncIterator[bytes], signature: Optional[str]) -> Dict[str, Any]:
+        """
+        Verify and process a Stripe webhook event while its body is being received.
+        
+        The HMAC is fed chunk by chunk, so verification finishes as soon as the
+        last chunk arrives instead of after a separate pass over the buffered body.
+        
+        Args:
+            chunks: Async iterator over the raw request body
+            signature: Stripe signature header
+            
+        Returns:
+            Processed event data
+        """
+        timestamp, signatures = _parse_signature_header(signature)
+        mac = hmac.new(STRIPE_WEBHOOK_SECRET.encode("utf-8"), f"{timestamp}.".encode("ascii"), hashlib.sha256)
+        body = bytearray()
+        async for chunk in chunks:
+            mac.update(chunk)
+            body += chunk
+        
+        expected = mac.hexdigest()
+        if not any(hmac.compare_digest(expected, candidate) for candidate in signatures):
+            logger.error("Invalid webhook signature: no matching v1 signature")
+            raise ValueError("Invalid webhook signature")
+        if abs(time.time() - timestamp) > WEBHOOK_TOLERANCE:
+            logger.error(f"Invalid webhook signature: timestamp {timestamp} outside the tolerance zone")
+            raise ValueError("Invalid webhook signature")
+        
+        try:
+            return PaymentService._process_event(orjson.loads(body))
+        except Exception as e:
+            logger.error(f"Error processing webhook: {str(e)}")
+            raise ValueError(f"Error processing webhook: {str(e)}")
+    
+    @staticmethod
+    def _process_event(event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Extract the fields we act on from a verified Stripe event.
+        
+        The event is the decoded JSON payload. It is read as plain dicts rather
+        than converted to stripe.Event, which would rebuild the whole payload as
+        nested StripeObjects only for a handful of fields to be read.
+        
+        Args:
+            event: Verified Stripe event payload
+            
+        Returns:
+            Processed event data
+        """
+        event_id = event["id"]
+        event_type = event["type"]
+        data = event["data"]["object"]
+        
+        # Process different event types
+        event_data = {
+            "id": event_id,
+            "type": event_type,
+            "created": datetime.fromtimestamp(event["created"]),
+            "data": data,
+            "processed": True,
+            "processing_result": {}
+        }
+        
+        if event_type == "checkout.session.completed":
+            # Handle successful checkout
+            session = data
+            customer_id = session.get("customer")
+            metadata = session.get("metadata") or {}
+            
+            event_data["processing_result"] = {
+                "customer_id": customer_id,
+                "product_id": metadata.get("product_id"),
+                "subscription_period": metadata.get("subscription_period"),
+                "is_subscription": session.get("mode") == "subscription"
+            }
+            
+            # In a real app, we would update the user's subscription status in our database
+            
+        elif event_type == "invoice.paid":
+            # Handle paid invoice
+            invoice = data
+            customer_id = invoice.get("customer")
+            subscription_id = invoice.get("subscription")
+            
+            event_data["processing_result"] = {
+                "customer_id": customer_id,
+                "subscription_id": subscription_id,
+                "amount": invoice.get("total"),
+                "currency": invoice.get("currency")
+            }
+            
+            # In a real app, we would update the user's subscription status in our database
+            
+        elif event_type == "customer.subscription.updated":
+            # Handle subscription update
+            subscription = data
+            customer_id = subscription.get("customer")
+            
+            event_data["processing_result"] = {
+                "customer_id": customer_id,
+                "subscription_id": subscription.get("id"),
+                "status": subscription.get("status"),
+                "cancel_at_period_end": subscription.get("cancel_at_period_end")
+            }
+            
+            # In a real app, we would update the user's subscription status in our database
+            
+        elif event_type == "customer.subscription.deleted":
+            # Handle subscription cancellation
+            subscription = data
+            customer_id = subscription.get("customer")
+            
+            event_data["processing_result"] = {
+                "customer_id": customer_id,
+                "subscription_id": subscription.get("id"),
+                "status": subscription.get("status")
+            }
+            
+            # In a real app, we would update the user's subscription status in our database
+        
+        logger.info(f"Processed webhook event: {event_id}, type: {event_type}")
+        return event_data
 
 # Initialize service
 payment_service = PaymentService() 
\ No newline at end of file
@@ -0,0 +1,231 @@
+import os
+import sys
+import orjson
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Backend-modulene importeres som toppnivåpakker (models, routes, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from routes import property_routes
+from routes.auth_routes import get_current_active_user, User
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(property_routes.router)
+    app.dependency_overrides[get_current_active_user] = lambda: User(id=1, username="testuser")
+    return TestClient(app)
+
+@pytest_asyncio.fixture
+async def new_property():
+    """Oppretter en eiendom gjennom rutefunksjonen og sletter den etter testen"""
+    created = await property_routes.create_property(
+        property_routes.PropertyCreate(
+            address="Testveien 12, 3015 Drammen",
+            area=640.0,
+            coordinates={"latitude": 59.74, "longitude": 10.2},
+            municipality_code="3005",
+            land_use_category={"name": "Næring", "code": "1300"},
+            buildings=[{"id": "b1", "building_type": {"name": "Kontorbygg", "code": "311"}}]
+        ),
+        current_user=None
+    )
+    yield created["id"]
+    if created["id"] in property_routes.mock_properties:
+        await property_routes.delete_property(created["id"], current_user=None)
+
+async def search(page=1, size=10, **params):
+    response = await property_routes.search_properties(
+        property_routes.PropertySearchParams(**params), page=page, size=size, current_user=None
+    )
+    return orjson.loads(response.body)
+
+async def search_ids(**params):
+    return [p["id"] for p in (await search(**params))["properties"]]
+
+@pytest.mark.api
+class TestPropertySearchIndex:
+    @pytest.mark.asyncio
+    async def test_search_finds_created_property(self, new_property):
+        """Nye eiendommer er med i søkeindeksene"""
+        assert await search_ids(address="TESTVEIEN") == [new_property]
+        assert await search_ids(municipality_code="3005") == [new_property]
+        assert await search_ids(land_use_category="næring") == [new_property]
+        assert await search_ids(land_use_category="1300") == [new_property]
+        assert await search_ids(building_type="kontorbygg") == [new_property]
+        assert await search_ids(building_type="311", min_area=600, max_area=700) == [new_property]
+
+    @pytest.mark.asyncio
+    async def test_update_moves_property_between_indexes(self, new_property):
+        """Oppdateringer av kommune, adresse og areal gjenspeiles i søk og sortering"""
+        await property_routes.update_property(
+            new_property,
+            property_routes.PropertyUpdate(municipality_code="0301", address="Nyveien 1, 0150 Oslo", area=50.0),
+            current_user=None
+        )
+
+        assert await search_ids(municipality_code="3005") == []
+        assert new_property in await search_ids(municipality_code="0301")
+        assert await search_ids(address="testveien") == []
+        assert await search_ids(address="nyveien") == [new_property]
+        assert property_routes._sorted_by_area[0] == new_property
+
+    @pytest.mark.asyncio
+    async def test_deleted_property_is_not_found(self, new_property):
+        await property_routes.delete_property(new_property, current_user=None)
+
+        assert await search_ids(address="testveien") == []
+        assert new_property not in property_routes._sorted_by_area
+        assert new_property not in property_routes._sorted_by_date
+        assert "3005" not in property_routes._by_municipality
+
+    @pytest.mark.asyncio
+    async def test_incomplete_property_keeps_search_working(self):
+        """Manglende felt i arealbruk og bygninger skal ikke ødelegge søkeindeksen"""
+        created = await property_routes.create_property(
+            property_routes.PropertyCreate(
+                address="Ufullstendig vei 1",
+                area=10.0,
+                coordinates={"latitude": 59.0, "longitude": 10.0},
+                municipality_code="4601",
+                land_use_category={},
+                buildings=[{"id": "b1"}, {"id": "b2", "building_type": {"name": "Garasje"}}]
+            ),
+            current_user=None
+        )
+        try:
+            assert await search_ids(address="ufullstendig") == [created["id"]]
+            assert await search_ids(building_type="garasje") == [created["id"]]
+            assert await search_ids(land_use_category="bolig", municipality_code="4601") == []
+
+            await property_routes.update_property(
+                created["id"],
+                property_routes.PropertyUpdate(land_use_category={"code": "1110"}),
+                current_user=None
+            )
+            assert await search_ids(land_use_category="1110", municipality_code="4601") == [created["id"]]
+        finally:
+            await property_routes.delete_property(created["id"], current_user=None)
+
+    @pytest.mark.asyncio
+    async def test_failed_update_leaves_indexes_untouched(self, new_property, monkeypatch):
+        def broken_terms(property_dict):
+            raise KeyError("land_use_category")
+        monkeypatch.setattr(property_routes, "_search_terms", broken_terms)
+
+        with pytest.raises(KeyError):
+            await property_routes.update_property(
+                new_property,
+                property_routes.PropertyUpdate(municipality_code="0301", area=1.0),
+                current_user=None
+            )
+        monkeypatch.undo()
+
+        assert property_routes.mock_properties[new_property]["municipality_code"] == "3005"
+        assert await search_ids(municipality_code="3005") == [new_property]
+        assert await search_ids(address="testveien", min_area=600) == [new_property]
+
+    @pytest.mark.asyncio
+    async def test_search_pagination_counts_all_matches(self, new_property):
+        data = await search(page=2, size=1)
+        assert data["total"] == len(property_routes.mock_properties)
+        assert len(data["properties"]) == 1
+
+@pytest.mark.api
+class TestModelDownload:
+    @pytest.fixture
+    def model_file(self, tmp_path, monkeypatch):
+        """Modellfilen ligger relativt til backend-mappen, som i drift"""
+        models_dir = tmp_path / "frontend" / "public" / "models" / "properties"
+        models_dir.mkdir(parents=True)
+        (tmp_path / "backend").mkdir()
+        monkeypatch.chdir(tmp_path / "backend")
+        path = models_dir / "property1.json"
+        path.write_text('{"vertices": []}')
+        return path
+
+    def test_download_sets_etag(self, client, model_file):
+        response = client.get("/properties/property1/models/model1/download")
+        assert response.status_code == 200
+        assert response.content == b'{"vertices": []}'
+        assert response.headers["etag"].startswith('"')
+
+    def test_matching_etag_returns_304(self, client, model_file):
+        etag = client.get("/properties/property1/models/model1/download").headers["etag"]
+        response = client.get(
+            "/properties/property1/models/model1/download",
+            headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    def test_changed_file_gets_new_etag(self, client, model_file):
+        etag = client.get("/properties/property1/models/model1/download").headers["etag"]
+        model_file.write_text('{"vertices": [[0, 0, 0]]}')
+        response = client.get(
+            "/properties/property1/models/model1/download",
+            headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    @pytest.mark.parametrize("if_none_match", [
+        "{etag}",
+        "W/{etag}",
+        '"annen", {etag}',
+        '"annen",W/{etag} ',
+        "*",
+    ])
+    def test_if_none_match_forms_return_304(self, client, model_file, if_none_match):
+        """Svake tagger, lister og * matcher også, som for GET i HTTP"""
+        etag = client.get("/properties/property1/models/model1/download").headers["etag"]
+        response = client.get(
+            "/properties/property1/models/model1/download",
+            headers={"If-None-Match": if_none_match.format(etag=etag)}
+        )
+        assert response.status_code == 304
+
+    def test_other_etags_return_200(self, client, model_file):
+        response = client.get(
+            "/properties/property1/models/model1/download",
+            headers={"If-None-Match": '"annen", W/"enda-en"'}
+        )
+        assert response.status_code == 200
+
+    def test_missing_model_is_404(self, client, model_file):
+        model_file.unlink()
+        response = client.get("/properties/property1/models/model1/download")
+        assert response.status_code == 404
+
+@pytest.mark.api
+class TestModelPreview:
+    @pytest.fixture
+    def preview_image(self, tmp_path, monkeypatch):
+        images_dir = tmp_path / "frontend" / "public" / "images"
+        images_dir.mkdir(parents=True)
+        (tmp_path / "backend").mkdir()
+        monkeypatch.chdir(tmp_path / "backend")
+        path = images_dir / "property-hero.jpg"
+        path.write_bytes(b"\xff\xd8jpeg")
+        return path
+
+    def test_preview_sets_etag(self, client, preview_image):
+        response = client.get("/properties/property1/models/model1/preview")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.content == b"\xff\xd8jpeg"
+
+        response = client.get(
+            "/properties/property1/models/model1/preview",
+            headers={"If-None-Match": response.headers["etag"]}
+        )
+        assert response.status_code == 304
+
+    def test_missing_preview_is_404(self, client, preview_image):
+        preview_image.unlink()
+        response = client.get("/properties/property1/models/model1/preview")
+        assert response.status_code == 404
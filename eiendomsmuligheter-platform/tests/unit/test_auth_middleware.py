@@ -0,0 +1,176 @@
+import os
+import sys
+import asyncio
+import contextlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import fakeredis
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from fastapi.security import SecurityScopes
+from starlette.requests import Request
+
+# Backend-modulene importeres som toppnivåpakker (middleware, routes, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from middleware import auth as middleware_auth
+
+def proxied_request() -> Request:
+    """Forespørsel slik den ser ut bak nginx: alle klienter har proxyens adresse"""
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [], "client": ("10.0.0.2", 40000)})
+
+async def current_user(user_id: str):
+    token = middleware_auth.create_access_token({"sub": user_id, "scopes": ["user"]})
+    return await middleware_auth.get_current_user(SecurityScopes(["user"]), token, proxied_request(), None)
+
+@pytest.mark.unit
+@pytest.mark.security
+class TestPerUserRateLimit:
+    @pytest.fixture
+    def hits(self, monkeypatch):
+        """Erstatter Redis-oppslaget med en teller per nøkkel og en grense på to forespørsler"""
+        hits = Counter()
+        async def check_token_state(jti, exp_ts, key):
+            hits[key] += 1
+            return False, hits[key] <= 2
+        monkeypatch.setattr(middleware_auth, "check_token_state", check_token_state)
+        return hits
+
+    @pytest.mark.asyncio
+    async def test_limit_is_keyed_on_the_token_subject(self, hits):
+        await current_user("user-1")
+        await current_user("user-2")
+        assert set(hits) == {"user:user-1", "user:user-2"}
+
+    @pytest.mark.asyncio
+    async def test_users_behind_the_same_proxy_have_separate_limits(self, hits):
+        await current_user("user-1")
+        await current_user("user-1")
+        with pytest.raises(HTTPException) as exc_info:
+            await current_user("user-1")
+        assert exc_info.value.status_code == 429
+
+        user = await current_user("user-2")
+        assert user.id == "user-2"
+
+@pytest.mark.unit
+class TestBloomFilter:
+    def test_added_digests_are_found(self):
+        bloom = middleware_auth._BloomFilter(1000, 1e-4)
+        digests = [middleware_auth._jti_key(f"jti-{i}") for i in range(1000)]
+        for digest in digests:
+            bloom.add(digest)
+        assert all(digest in bloom for digest in digests)
+
+    def test_false_positive_rate_is_low(self):
+        bloom = middleware_auth._BloomFilter(1000, 1e-4)
+        for i in range(1000):
+            bloom.add(middleware_auth._jti_key(f"jti-{i}"))
+        false_positives = sum(middleware_auth._jti_key(f"other-{i}") in bloom for i in range(10000))
+        assert false_positives <= 10
+
+async def wait_for_sync():
+    """Venter til blacklist-filteret er lastet fra Redis og følger kanalen"""
+    for _ in range(100):
+        if middleware_auth._blacklist_filter_ready:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Blacklist-filteret ble aldri lastet")
+
+@pytest.mark.unit
+@pytest.mark.security
+class TestTokenBlacklist:
+    @pytest_asyncio.fixture
+    async def fake_redis(self, monkeypatch):
+        """Tom Redis i minnet, og et blacklist-filter som ikke er lastet ennå"""
+        client = fakeredis.aioredis.FakeRedis()
+        monkeypatch.setattr(middleware_auth, "get_redis", lambda: client)
+        monkeypatch.setattr(middleware_auth, "_blacklist_filter", middleware_auth._BloomFilter(1000, 1e-4))
+        monkeypatch.setattr(middleware_auth, "_blacklist_filter_ready", False)
+        monkeypatch.setattr(middleware_auth, "_blacklist_sync_task", None)
+        monkeypatch.setattr(middleware_auth, "BLACKLIST_SYNC_RETRY", 0.01)
+        middleware_auth._redis_script.cache_clear()
+        yield client
+        task = middleware_auth._blacklist_sync_task
+        if task is not None:
+            # fakeredis henger hvis oppgaven avbrytes midt i subscribe
+            await wait_for_sync()
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        middleware_auth._redis_script.cache_clear()
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_tokens_are_grouped_in_daily_shards(self, fake_redis):
+        now = datetime.now(timezone.utc)
+        tomorrow, next_week = now + timedelta(days=1), now + timedelta(days=7)
+
+        assert await middleware_auth.blacklist_tokens([
+            ("jti-1", tomorrow), ("jti-2", tomorrow), ("jti-3", next_week), ("expired", now - timedelta(hours=1))
+        ])
+
+        shard = middleware_auth._blacklist_shard(tomorrow.timestamp())
+        assert await fake_redis.smembers(shard) == {
+            middleware_auth._jti_key("jti-1"), middleware_auth._jti_key("jti-2")
+        }
+        assert await fake_redis.smembers(middleware_auth._blacklist_shard(next_week.timestamp())) == {
+            middleware_auth._jti_key("jti-3")
+        }
+        assert 0 < await fake_redis.ttl(shard) <= 2 * 86400
+        keys = {key.decode() async for key in fake_redis.scan_iter(match="blacklist:day:*")}
+        assert keys == {shard, middleware_auth._blacklist_shard(next_week.timestamp())}
+
+    @pytest.mark.asyncio
+    async def test_revoked_token_is_rejected(self, fake_redis):
+        exp = datetime.now(timezone.utc) + timedelta(hours=1)
+        await middleware_auth.blacklist_token("revoked", exp)
+
+        assert await middleware_auth.is_token_blacklisted("revoked", exp)
+        assert not await middleware_auth.is_token_blacklisted("valid", exp)
+
+        blacklisted, within_limit = await middleware_auth.check_token_state("revoked", exp.timestamp(), "user:1")
+        assert blacklisted and within_limit
+
+    @pytest.mark.asyncio
+    async def test_filter_is_loaded_from_redis(self, fake_redis):
+        """Revokeringer gjort av andre arbeidere før oppstart havner i det lokale filteret"""
+        exp = datetime.now(timezone.utc) + timedelta(hours=1)
+        await fake_redis.sadd(middleware_auth._blacklist_shard(exp.timestamp()), middleware_auth._jti_key("earlier"))
+
+        assert await middleware_auth.is_token_blacklisted("earlier", exp)
+        await wait_for_sync()
+
+        assert middleware_auth._jti_key("earlier") in middleware_auth._blacklist_filter
+        assert middleware_auth._jti_key("valid") not in middleware_auth._blacklist_filter
+
+    @pytest.mark.asyncio
+    async def test_published_revocations_reach_the_filter(self, fake_redis):
+        """Revokeringer fra andre arbeidere kommer fram via pub/sub-kanalen"""
+        exp = datetime.now(timezone.utc) + timedelta(hours=1)
+        assert not await middleware_auth.is_token_blacklisted("later", exp)
+        await wait_for_sync()
+
+        digests = middleware_auth._jti_key("later") + middleware_auth._jti_key("later-2")
+        await fake_redis.publish(middleware_auth.BLACKLIST_CHANNEL, digests)
+        for _ in range(100):
+            if middleware_auth._jti_key("later-2") in middleware_auth._blacklist_filter:
+                break
+            await asyncio.sleep(0.01)
+
+        assert middleware_auth._jti_key("later") in middleware_auth._blacklist_filter
+        assert middleware_auth._jti_key("later-2") in middleware_auth._blacklist_filter
+
+    @pytest.mark.asyncio
+    async def test_filter_miss_skips_redis(self, fake_redis, monkeypatch):
+        """Når filteret er lastet, slår ikke ukjente JTI-er opp i Redis"""
+        exp = datetime.now(timezone.utc) + timedelta(hours=1)
+        await middleware_auth.is_token_blacklisted("valid", exp)
+        await wait_for_sync()
+
+        async def sismember(*args):
+            raise AssertionError("Redis skulle ikke vært spurt")
+        monkeypatch.setattr(fake_redis, "sismember", sismember)
+
+        assert not await middleware_auth.is_token_blacklisted("valid", exp)
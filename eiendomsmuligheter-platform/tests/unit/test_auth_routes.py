@@ -0,0 +1,104 @@
+import os
+import sys
+from collections import Counter
+import pytest
+from cachetools import TTLCache
+
+# Backend-modulene importeres som toppnivåpakker (middleware, routes, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from middleware import auth as middleware_auth
+from routes import auth_routes
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.unit
+class TestUserCache:
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        clock = FakeClock()
+        monkeypatch.setattr(
+            auth_routes, "_user_cache", TTLCache(maxsize=8, ttl=auth_routes.USER_CACHE_TTL, timer=clock)
+        )
+        return clock
+
+    @pytest.fixture
+    def rows(self, monkeypatch):
+        """Brukertabell i minnet, med en teller for oppslag per brukernavn"""
+        rows, lookups = {}, Counter()
+        def fetch_user_row(username):
+            lookups[username] += 1
+            return rows.get(username)
+        monkeypatch.setattr(auth_routes, "_fetch_user_row", fetch_user_row)
+        rows["testuser"] = {
+            "id": 1, "username": "testuser", "email": None, "full_name": None,
+            "hashed_password": "hash", "is_active": 1
+        }
+        return rows, lookups
+
+    def test_known_user_is_cached(self, clock, rows):
+        _, lookups = rows
+        user, hashed_password = auth_routes._get_user_cached("testuser")
+        assert auth_routes._get_user_cached("testuser") == (user, hashed_password)
+        assert user.username == "testuser" and hashed_password == "hash"
+        assert lookups["testuser"] == 1
+
+    def test_unknown_user_is_not_cached(self, clock, rows):
+        """Et mislykket oppslag skal ikke skjule en bruker som opprettes senere"""
+        table, lookups = rows
+        assert auth_routes._get_user_cached("ny") == (None, None)
+        table["ny"] = dict(table["testuser"], id=2, username="ny")
+
+        assert auth_routes._get_user_cached("ny")[0].id == 2
+        assert lookups["ny"] == 2
+
+    def test_deactivation_is_seen_after_ttl(self, clock, rows):
+        table, lookups = rows
+        assert auth_routes.get_user("testuser").is_active
+        table["testuser"] = dict(table["testuser"], is_active=0)
+
+        clock.now += auth_routes.USER_CACHE_TTL + 1
+        assert not auth_routes.get_user("testuser").is_active
+        assert lookups["testuser"] == 2
+
+    def test_clear_forgets_cached_users(self, clock, rows):
+        _, lookups = rows
+        auth_routes.get_user("testuser")
+        auth_routes._clear_user_cache()
+        auth_routes.get_user("testuser")
+        assert lookups["testuser"] == 2
+
+@pytest.mark.unit
+@pytest.mark.security
+class TestPasswords:
+    def test_hashes_come_from_middleware(self):
+        assert auth_routes.get_password_hash is middleware_auth.get_password_hash
+
+    @pytest.mark.asyncio
+    async def test_repeated_login_reuses_verification(self, monkeypatch):
+        """Innlogging går via middleware sin verifiseringscache; feil passord sjekkes hver gang"""
+        user = auth_routes.User(id=1, username="testuser")
+        monkeypatch.setattr(auth_routes, "_get_user_cached", lambda username: (user, "hash"))
+        monkeypatch.setattr(middleware_auth, "_verified_passwords", TTLCache(maxsize=8, ttl=60))
+        checks = Counter()
+        def checkpw(plain_password, hashed_password):
+            checks[plain_password] += 1
+            return plain_password == "riktig"
+        monkeypatch.setattr(middleware_auth, "_checkpw", checkpw)
+
+        assert await auth_routes.authenticate_user("testuser", "riktig") is user
+        assert await auth_routes.authenticate_user("testuser", "riktig") is user
+        assert await auth_routes.authenticate_user("testuser", "feil") is False
+        assert await auth_routes.authenticate_user("testuser", "feil") is False
+        assert checks == {"riktig": 1, "feil": 2}
+
+    def test_hash_is_verified_at_login(self):
+        hashed_password = auth_routes.get_password_hash("hemmelig")
+        assert hashed_password.startswith("$2b$")
+        assert auth_routes.verify_password("hemmelig", hashed_password)
+        assert not auth_routes.verify_password("feil", hashed_password)
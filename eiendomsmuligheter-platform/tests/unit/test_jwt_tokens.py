@@ -0,0 +1,92 @@
+import os
+import sys
+import base64
+import time
+from datetime import timedelta
+import jwt
+import pytest
+from fastapi import HTTPException
+
+# Backend-modulene importeres som toppnivåpakker (middleware, routes, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from middleware import auth as middleware_auth
+from routes import auth_routes
+
+def _replace_segment(token: str, index: int, segment: bytes) -> str:
+    parts = token.split(".")
+    parts[index] = base64.urlsafe_b64encode(segment).rstrip(b"=").decode("ascii")
+    return ".".join(parts)
+
+@pytest.mark.unit
+@pytest.mark.security
+class TestAuthRouteTokens:
+    """Innloggingsrutene utsteder og verifiserer tokens gjennom middleware"""
+
+    @pytest.fixture
+    def known_user(self, monkeypatch):
+        user = auth_routes.User(id=1, username="testuser")
+        monkeypatch.setattr(auth_routes, "get_user", lambda username: user if username == "testuser" else None)
+        return user
+
+    def test_uses_middleware_tokens(self):
+        assert auth_routes.create_access_token is middleware_auth.create_access_token
+        assert auth_routes.decode_token is middleware_auth.decode_token
+
+    @pytest.mark.asyncio
+    async def test_login_token_is_accepted(self, known_user):
+        token = auth_routes.create_access_token({"sub": "testuser"}, timedelta(minutes=5))
+        assert await auth_routes.get_current_user(token) is known_user
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("token", [
+        jwt.encode({"sub": "testuser"}, "feil-nøkkel-som-er-minst-32-byte-lang", algorithm="HS256"),
+        middleware_auth.create_access_token({"sub": "testuser"}, timedelta(seconds=-1)),
+        middleware_auth.create_access_token({"sub": "ukjent"}),
+        "abc",
+    ])
+    async def test_invalid_token_is_rejected(self, known_user, token):
+        with pytest.raises(HTTPException) as exc_info:
+            await auth_routes.get_current_user(token)
+        assert exc_info.value.status_code == 401
+
+@pytest.mark.unit
+@pytest.mark.security
+class TestMiddlewareTokens:
+    """Tokens fra _encode_jwt skal være gyldige HS256-tokens for pyjwt"""
+
+    def test_roundtrip(self):
+        token = middleware_auth.create_access_token({"sub": "user-1", "scopes": ["user"]})
+        payload = middleware_auth.decode_token(token)
+        assert payload["sub"] == "user-1"
+        assert payload["scopes"] == ["user"]
+        assert payload["type"] == "access"
+        assert payload["exp"] > payload["iat"]
+
+    def test_matches_pyjwt_encoding(self):
+        secret_key = middleware_auth.get_auth_settings().secret_key
+        payload = {"sub": "user-1", "exp": int(time.time()) + 60}
+        token = middleware_auth._encode_jwt(payload)
+        assert token == jwt.encode(payload, secret_key, algorithm="HS256")
+        assert jwt.decode(token, secret_key, algorithms=["HS256"]) == payload
+
+    def test_tampered_payload_is_rejected(self):
+        token = middleware_auth.create_access_token({"sub": "user-1"})
+        forged = _replace_segment(token, 1, b'{"sub":"admin","exp":9999999999}')
+        with pytest.raises(jwt.InvalidSignatureError):
+            middleware_auth.decode_token(forged)
+
+    def test_expired_token_is_rejected(self):
+        token = middleware_auth.create_access_token({"sub": "user-1"}, timedelta(seconds=-1))
+        with pytest.raises(jwt.ExpiredSignatureError):
+            middleware_auth.decode_token(token)
+
+    def test_foreign_header_is_rejected(self):
+        token = middleware_auth.create_access_token({"sub": "user-1"})
+        unsigned = _replace_segment(token, 0, b'{"alg":"none","typ":"JWT"}')
+        with pytest.raises(jwt.InvalidAlgorithmError):
+            middleware_auth.decode_token(unsigned)
+
+    def test_global_algorithms_are_untouched(self):
+        """Den forhåndsnøklede HMAC-en brukes bare av middleware, ikke av jwt.encode/jwt.decode"""
+        assert jwt.get_algorithm_by_name("HS256") is not middleware_auth._hs256
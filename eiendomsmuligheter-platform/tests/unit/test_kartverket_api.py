@@ -0,0 +1,66 @@
+import os
+import sys
+import pytest
+
+# Backend-modulene importeres som toppnivåpakker (api, services, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from api.KartverketAPI import KartverketAPI, MOCK_PROPERTIES
+
+@pytest.fixture
+def kartverket(monkeypatch):
+    monkeypatch.setenv("KARTVERKET_MOCK", "1")
+    return KartverketAPI()
+
+@pytest.mark.unit
+class TestMockPropertyIndexes:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("address", [
+        "Solbergveien 47, 3057 Solbergmoen",
+        "solbergveien 47",
+        "  SOLBERGVEIEN   47 , 3057",
+    ])
+    async def test_address_lookup_is_normalized(self, kartverket, address):
+        """Søk på gateadresse ignorerer store bokstaver, mellomrom og postnummer"""
+        prop = await kartverket.get_property_by_address(address)
+        assert prop["property_id"] == "3005-12-345-6-7"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("address", ["Solbergveien 48", "Solbergveien", "Storgata 1, 3005 Drammen"])
+    async def test_unknown_address_is_none(self, kartverket, address):
+        assert await kartverket.get_property_by_address(address) is None
+
+    @pytest.mark.asyncio
+    async def test_matrikkel_lookup_returns_same_property(self, kartverket):
+        by_address = await kartverket.get_property_by_address("Solbergveien 47")
+        by_matrikkel = await kartverket.get_property_by_matrikkel("3005", 12, 345)
+        assert by_matrikkel is by_address
+        assert by_matrikkel is MOCK_PROPERTIES[0]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("key", [("3005", 12, 346), ("3006", 12, 345), ("3005", 13, 345)])
+    async def test_unknown_matrikkel_is_none(self, kartverket, key):
+        assert await kartverket.get_property_by_matrikkel(*key) is None
+
+@pytest.mark.unit
+class TestMockMode:
+    @pytest.mark.asyncio
+    async def test_api_key_alone_keeps_mock_mode(self, monkeypatch):
+        """En API-nøkkel alene skal ikke slå på live-kall"""
+        monkeypatch.delenv("KARTVERKET_MOCK", raising=False)
+        api = KartverketAPI(api_key="test-key")
+        assert (await api.get_property_by_address("Solbergveien 47"))["gnr"] == 12
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("call", [
+        lambda api: api.get_property_by_address("Solbergveien 47"),
+        lambda api: api.get_property_by_matrikkel("3005", 12, 345),
+        lambda api: api.get_property_boundaries("3005", 12, 345),
+        lambda api: api.get_elevation_data(59.75, 10.25),
+    ])
+    async def test_live_mode_is_refused(self, monkeypatch, call):
+        """Live-modus er ikke implementert, og skal feile i stedet for å returnere rå API-svar"""
+        monkeypatch.setenv("KARTVERKET_MOCK", "0")
+        api = KartverketAPI(api_key="test-key")
+        with pytest.raises(NotImplementedError):
+            await call(api)
@@ -0,0 +1,62 @@
+import os
+import sys
+import math
+import random
+import pytest
+
+# Backend-modulene importeres som toppnivåpakker (models, services, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from models.property import find_invalid_ownerships, OWNERSHIP_SUM_TOLERANCE
+
+def flatten(shares_per_property):
+    """Legger eierandelene etter hverandre, med start-indeks per eiendom pluss totalen"""
+    offsets, percentages = [0], []
+    for shares in shares_per_property:
+        percentages.extend(shares)
+        offsets.append(len(percentages))
+    return offsets, percentages
+
+def reference(shares_per_property):
+    """Samme regler som Property-validatoren, én eiendom om gangen"""
+    return [
+        i for i, shares in enumerate(shares_per_property)
+        if shares and (
+            any(share < 0 or share > 100 for share in shares)
+            or abs(math.fsum(shares) - 100.0) > OWNERSHIP_SUM_TOLERANCE
+        )
+    ]
+
+@pytest.mark.unit
+class TestFindInvalidOwnerships:
+    def test_valid_batch(self):
+        assert find_invalid_ownerships(*flatten([[100.0], [50.0, 50.0], [33.33, 33.33, 33.34]])) == []
+
+    def test_wrong_sums_are_reported(self):
+        shares = [[100.0], [60.0, 30.0], [50.0, 50.0], [70.0, 40.0]]
+        assert find_invalid_ownerships(*flatten(shares)) == [1, 3]
+
+    def test_share_out_of_range_is_reported(self):
+        """En negativ andel kan gi riktig sum, men er likevel ugyldig"""
+        shares = [[100.0], [120.0, -20.0], [50.0, 50.0], [100.0, 0.0, 100.5]]
+        assert find_invalid_ownerships(*flatten(shares)) == [1, 3]
+
+    def test_properties_without_owners_are_valid(self):
+        shares = [[], [100.0], [], [-5.0, 105.0], []]
+        assert find_invalid_ownerships(*flatten(shares)) == [3]
+
+    def test_empty_batch(self):
+        assert find_invalid_ownerships([0], []) == []
+
+    def test_matches_per_property_check(self):
+        rng = random.Random(4)
+        shares = []
+        for _ in range(2000):
+            count = rng.randint(0, 4)
+            if rng.random() < 0.5 and count:
+                split = [rng.random() for _ in range(count)]
+                shares.append([100.0 * part / sum(split) for part in split])
+            else:
+                shares.append([rng.uniform(-10, 110) for _ in range(count)])
+
+        assert find_invalid_ownerships(*flatten(shares)) == reference(shares)
@@ -0,0 +1,104 @@
+import os
+import sys
+import hashlib
+import hmac
+import time
+import orjson
+import pytest
+
+# Backend-modulene importeres som toppnivåpakker (services, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from services import payment
+from services.payment import PaymentService, _parse_signature_header
+
+EVENT = {
+    "id": "evt_123",
+    "type": "invoice.paid",
+    "created": 1700000000,
+    "data": {"object": {"customer": "cus_123", "subscription": "sub_123", "total": 29900, "currency": "nok"}}
+}
+
+def sign(body: bytes, timestamp: int, secret: str = None) -> str:
+    secret = secret or payment.STRIPE_WEBHOOK_SECRET
+    signed = f"{timestamp}.".encode("ascii") + body
+    return hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+
+async def stream(body: bytes, chunk_size: int = 7):
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+@pytest.mark.unit
+@pytest.mark.security
+class TestParseSignatureHeader:
+    def test_timestamp_and_signatures(self):
+        assert _parse_signature_header("t=1700000000,v1=abc,v0=old,v1=def") == (1700000000, ["abc", "def"])
+
+    def test_whitespace_is_ignored(self):
+        assert _parse_signature_header(" t=1, v1=abc ") == (1, ["abc"])
+
+    @pytest.mark.parametrize("header", [None, "", "v1=abc", "t=1700000000", "t=abc,v1=abc", "t=-1,v1=abc"])
+    def test_malformed_header_is_rejected(self, header):
+        with pytest.raises(ValueError):
+            _parse_signature_header(header)
+
+@pytest.mark.unit
+@pytest.mark.security
+class TestVerifyWebhookStream:
+    @pytest.mark.asyncio
+    async def test_valid_signature(self):
+        body = orjson.dumps(EVENT)
+        timestamp = int(time.time())
+        header = f"t={timestamp},v1={sign(body, timestamp)}"
+
+        event = await PaymentService.verify_webhook_stream(stream(body), header)
+
+        assert event["id"] == "evt_123"
+        assert event["processing_result"]["subscription_id"] == "sub_123"
+
+    @pytest.mark.asyncio
+    async def test_any_matching_signature_is_accepted(self):
+        """Under rotasjon av hemmeligheten sender Stripe én v1 per hemmelighet"""
+        body = orjson.dumps(EVENT)
+        timestamp = int(time.time())
+        header = f"t={timestamp},v1={sign(body, timestamp, 'whsec_old')},v1={sign(body, timestamp)}"
+
+        event = await PaymentService.verify_webhook_stream(stream(body), header)
+
+        assert event["type"] == "invoice.paid"
+
+    @pytest.mark.asyncio
+    async def test_tampered_body_is_rejected(self):
+        body = orjson.dumps(EVENT)
+        timestamp = int(time.time())
+        header = f"t={timestamp},v1={sign(body, timestamp)}"
+
+        with pytest.raises(ValueError, match="Invalid webhook signature"):
+            await PaymentService.verify_webhook_stream(stream(body.replace(b"29900", b"1")), header)
+
+    @pytest.mark.asyncio
+    async def test_wrong_secret_is_rejected(self):
+        body = orjson.dumps(EVENT)
+        timestamp = int(time.time())
+        header = f"t={timestamp},v1={sign(body, timestamp, 'whsec_other')}"
+
+        with pytest.raises(ValueError, match="Invalid webhook signature"):
+            await PaymentService.verify_webhook_stream(stream(body), header)
+
+    @pytest.mark.asyncio
+    async def test_stale_timestamp_is_rejected(self):
+        body = orjson.dumps(EVENT)
+        timestamp = int(time.time()) - payment.WEBHOOK_TOLERANCE - 10
+        header = f"t={timestamp},v1={sign(body, timestamp)}"
+
+        with pytest.raises(ValueError, match="Invalid webhook signature"):
+            await PaymentService.verify_webhook_stream(stream(body), header)
+
+    @pytest.mark.asyncio
+    async def test_signed_invalid_json_is_rejected(self):
+        body = b"not json"
+        timestamp = int(time.time())
+        header = f"t={timestamp},v1={sign(body, timestamp)}"
+
+        with pytest.raises(ValueError, match="Error processing webhook"):
+            await PaymentService.verify_webhook_stream(stream(body), header)
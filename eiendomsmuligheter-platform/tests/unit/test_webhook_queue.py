@@ -0,0 +1,158 @@
+import os
+import sys
+import asyncio
+import contextlib
+import fakeredis
+import pytest
+import pytest_asyncio
+
+# Backend-modulene importeres som toppnivåpakker (routes, services, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+
+from routes import payment_routes
+
+EVENT = {"id": "evt_123", "type": "test.event", "data": {"object": {"id": "cus_123"}}}
+
+class FakeRequest:
+    def stream(self):
+        return None
+
+@pytest_asyncio.fixture
+async def fake_redis(monkeypatch):
+    """Tom Redis i minnet for strømmen og duplikatsjekken"""
+    client = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(payment_routes, "get_redis", lambda: client)
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def handled(monkeypatch):
+    """Registrerer en håndterer for test.event som samler opp hendelsene den får"""
+    events = []
+    async def handler(event_data):
+        events.append(event_data["id"])
+    monkeypatch.setitem(payment_routes.EVENT_HANDLERS, "test.event", [handler])
+    return events
+
+@pytest.fixture
+def verified(monkeypatch):
+    """Hopper over signaturkontrollen; den testes i test_payment_webhook.py"""
+    async def verify_webhook_stream(stream, signature):
+        return dict(EVENT)
+    monkeypatch.setattr(payment_routes.payment_service, "verify_webhook_stream", verify_webhook_stream)
+
+async def deliver():
+    response = await payment_routes.webhook(FakeRequest(), "t=1,v1=signert")
+    # La hendelser som sendes ut i prosessen bli ferdige
+    await asyncio.gather(*payment_routes._webhook_tasks)
+    return response
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Betingelsen ble aldri oppfylt")
+
+@pytest.mark.unit
+class TestEnqueue:
+    @pytest.mark.asyncio
+    async def test_event_is_queued_when_workers_run(self, fake_redis, handled, verified, monkeypatch):
+        monkeypatch.setattr(payment_routes, "WEBHOOK_WORKER_ENABLED", True)
+
+        assert await deliver() == {"status": "success", "event_id": "evt_123"}
+
+        assert await fake_redis.xlen(payment_routes.WEBHOOK_STREAM) == 1
+        assert handled == []
+
+    @pytest.mark.asyncio
+    async def test_event_is_dispatched_in_process_without_workers(self, fake_redis, handled, verified, monkeypatch):
+        """Uten konsumenter ville ingen lest strømmen, så hendelsen håndteres direkte"""
+        monkeypatch.setattr(payment_routes, "WEBHOOK_WORKER_ENABLED", False)
+
+        assert await deliver() == {"status": "success", "event_id": "evt_123"}
+
+        assert await fake_redis.exists(payment_routes.WEBHOOK_STREAM) == 0
+        assert handled == ["evt_123"]
+
+    @pytest.mark.asyncio
+    async def test_event_is_dispatched_in_process_without_redis(self, handled, verified, monkeypatch):
+        monkeypatch.setattr(payment_routes, "WEBHOOK_WORKER_ENABLED", True)
+        monkeypatch.setattr(payment_routes, "get_redis", lambda: None)
+
+        await deliver()
+
+        assert handled == ["evt_123"]
+
+@pytest.mark.unit
+class TestWebhookWorker:
+    @pytest_asyncio.fixture
+    async def worker(self, fake_redis, monkeypatch):
+        """Konsument som poller strømmen ofte, slik at testene ikke venter på blokkerende lesing"""
+        monkeypatch.setattr(payment_routes, "WEBHOOK_BLOCK_MS", 10)
+        monkeypatch.setattr(payment_routes, "WEBHOOK_WORKER_ENABLED", True)
+        # fakeredis svelger task.cancel() midt i en kommando, så konsumenten
+        # stoppes ved at neste lesing fra strømmen avbrytes
+        stopping = asyncio.Event()
+        xreadgroup = fake_redis.xreadgroup
+        async def stoppable_xreadgroup(*args, **kwargs):
+            if stopping.is_set():
+                raise asyncio.CancelledError
+            return await xreadgroup(*args, **kwargs)
+        monkeypatch.setattr(fake_redis, "xreadgroup", stoppable_xreadgroup)
+        task = asyncio.create_task(payment_routes.run_webhook_worker("test-consumer"))
+        yield task
+        stopping.set()
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.wait_for(task, 5)
+
+    @pytest.mark.asyncio
+    async def test_queued_events_are_dispatched_and_acknowledged(self, fake_redis, handled, worker):
+        for event_id in ("evt_1", "evt_2"):
+            assert await payment_routes.enqueue_event(dict(EVENT, id=event_id))
+
+        await wait_for(lambda: len(handled) == 2)
+        assert sorted(handled) == ["evt_1", "evt_2"]
+
+        async def pending():
+            return (await fake_redis.xpending(payment_routes.WEBHOOK_STREAM, payment_routes.WEBHOOK_GROUP))["pending"]
+        for _ in range(200):
+            if await pending() == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert await pending() == 0
+
+    @pytest.mark.asyncio
+    async def test_malformed_entry_does_not_stop_the_worker(self, fake_redis, handled, worker):
+        await fake_redis.xadd(payment_routes.WEBHOOK_STREAM, {"event": b"ikke json"})
+        assert await payment_routes.enqueue_event(dict(EVENT, id="evt_etter"))
+
+        await wait_for(lambda: handled == ["evt_etter"])
+        assert not worker.done()
+
+@pytest.mark.unit
+class TestIdempotency:
+    @pytest.mark.asyncio
+    async def test_event_is_claimed_once(self, fake_redis):
+        assert await payment_routes.claim_event("evt_123")
+        assert not await payment_routes.claim_event("evt_123")
+        assert await payment_routes.claim_event("evt_456")
+
+        key = payment_routes.WEBHOOK_EVENT_KEY_PREFIX + "evt_123"
+        assert 0 < await fake_redis.ttl(key) <= payment_routes.WEBHOOK_DEDUP_TTL
+
+    @pytest.mark.asyncio
+    async def test_retried_delivery_is_not_handled_again(self, fake_redis, handled, verified, monkeypatch):
+        """Stripe sender samme hendelse på nytt når svaret uteblir"""
+        monkeypatch.setattr(payment_routes, "WEBHOOK_WORKER_ENABLED", False)
+
+        assert await deliver() == {"status": "success", "event_id": "evt_123"}
+        assert await deliver() == {"status": "duplicate", "event_id": "evt_123"}
+        assert handled == ["evt_123"]
+
+    @pytest.mark.asyncio
+    async def test_events_are_handled_without_redis(self, monkeypatch):
+        """Uten Redis kan ikke duplikater oppdages, og hendelsen slippes gjennom"""
+        monkeypatch.setattr(payment_routes, "get_redis", lambda: None)
+        assert await payment_routes.claim_event("evt_123")
+        assert await payment_routes.claim_event("evt_123")